@@ -10,6 +10,8 @@ import copy
 import itertools
 import random
 import math
+import time
+from search_stats import timed
 
 ############################################################
 # Section 1: Dominoes Game
@@ -34,6 +36,9 @@ class DominoesGame(object):
         self.move = (0,0)
         self.leaves = 0
         self.depth = 0
+        self.stats = None
+        self.table = None
+        self.ordering = None
 
     def get_board(self):
         return self.board
@@ -88,6 +93,9 @@ class DominoesGame(object):
     def get_random_move(self, vertical):
         return random.choice(self.legal_moves(vertical))
 
+    # max_value / min_value search the list-of-lists board; get_best_move no longer calls
+    # them and runs DominoesBitboard, which visits the same nodes, so they are kept as
+    # the reference implementation that engine must agree with
     def max_value(self, vertical, limit, a, b, root):
         # difference in num of possible legal moves of current and other player
         if self.game_over(vertical) or limit == 0:
@@ -124,12 +132,371 @@ class DominoesGame(object):
         return v
 
     # Required
-    def get_best_move(self, vertical, limit):
+    def get_best_move(self, vertical, limit, stats=None, table=None, time_limit=None):
+        # the search runs on a DominoesBitboard; it visits the same nodes in the same order
+        # as max_value / min_value, so the move, value and leaves are theirs
+        # table, a TranspositionTable, lets positions reached again (or their reflections)
+        # reuse earlier results, within this call and across calls; the value and move are
+        # unchanged but fewer leaves are visited
+        # with time_limit (seconds) the search deepens one ply at a time up to limit (None
+        # for no limit) with ordered moves, and answers from the deepest search that
+        # finished in time; leaves then counts every search
         a = -math.inf
         b = math.inf
         root = self
         root.depth = limit
-        value = self.max_value(vertical, limit, a, b, root)
+        root.stats = stats
+        root.table = table
+        try:
+            with timed(stats):
+                engine = dominoes_bitboard(self.rows, self.cols)
+                occupied = engine.encode(self.board)
+                hashes = engine.hashes(occupied) if table is not None else None
+                if time_limit is not None:
+                    value = self.deepen(engine, occupied, vertical, limit, hashes, time_limit)
+                else:
+                    value = engine.max_value(occupied, vertical, limit, a, b, root, hashes)
+        finally:
+            root.stats = None
+            root.table = None
+            root.ordering = None
+        if stats is not None:
+            stats.frontier(root.depth) # depth first, one open node per ply
 
         return root.move, value, root.leaves
 
+    def deepen(self, engine, occupied, vertical, limit, hashes, time_limit):
+        # iterative deepening; each search tries the last one's principal variation first,
+        # and the first always finishes so there is a move to return
+        root = self
+        deepest = (engine.rows * engine.cols - bin(occupied).count("1")) // 2 # no game lasts longer
+        if limit is not None:
+            deepest = min(deepest, limit)
+        if deepest <= 0 or not engine.moves(occupied, vertical):
+            root.depth = limit if limit is not None else 0
+            return engine.max_value(occupied, vertical, root.depth, -math.inf, math.inf, root, hashes)
+        root.ordering = MoveOrdering(time.perf_counter() + time_limit)
+        best = None
+        for depth in range(1, deepest + 1):
+            root.depth = depth
+            root.ordering.begin(depth > 1)
+            try:
+                value = engine.max_value(occupied, vertical, depth, -math.inf, math.inf, root, hashes)
+            except SearchTimeout:
+                break
+            best = (root.move, value, depth)
+            root.ordering.finish()
+            if time.perf_counter() >= root.ordering.deadline:
+                break
+        root.move, value, root.depth = best
+        return value
+
+
+class SearchTimeout(Exception):
+    pass
+
+class MoveOrdering(object):
+
+    # move ordering for iterative deepening, per ply: the previous iteration's principal
+    # variation first, then killer moves (the last two that caused a cutoff at that ply),
+    # then moves by history (how much deep cutoffs they caused, for either side), then
+    # raster order; it also enforces the deadline, checking the clock every 256 nodes
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.pv = []
+        self.following = False
+        self.lines = [] # lines[ply] is the best line found below the node at ply
+        self.killers = []
+        self.history = {}
+        self.timed = False
+        self.nodes = 0
+        self.ply = -1
+
+    def begin(self, timed):
+        self.timed = timed
+        self.following = bool(self.pv)
+        self.ply = -1
+
+    def finish(self):
+        self.pv = self.lines[0] if self.lines else []
+
+    def enter(self, ply):
+        # the old principal variation is followed until a node is entered at a ply that is
+        # not deeper than the last one, i.e. the first path of the iteration has ended
+        if self.following and ply <= self.ply:
+            self.following = False
+        self.ply = ply
+        while len(self.lines) <= ply + 1:
+            self.lines.append([])
+            self.killers.append([])
+        self.lines[ply] = []
+        self.nodes += 1
+        if self.timed and not self.nodes & 255 and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def order(self, moves, vertical, ply):
+        killers = self.killers[ply]
+        history = self.history
+        moves.sort(key=lambda p: (p not in killers, -history.get((vertical, p), 0)))
+        if self.following:
+            if ply < len(self.pv) and self.pv[ply] in moves:
+                moves.remove(self.pv[ply])
+                moves.insert(0, self.pv[ply])
+            else:
+                self.following = False
+        return moves
+
+    def improve(self, ply, p):
+        self.lines[ply] = [p] + self.lines[ply + 1]
+
+    def cutoff(self, ply, vertical, p, limit):
+        killers = self.killers[ply]
+        if p not in killers:
+            killers.insert(0, p)
+            del killers[2:]
+        self.history[(vertical, p)] = self.history.get((vertical, p), 0) + limit * limit
+
+# bound types of TranspositionTable entries
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class TranspositionTable(object):
+
+    # a fixed number of slots, indexed by the low bits of a 64-bit key and holding the full
+    # key to tell positions apart; a slot is only overwritten by a search at least as deep
+    # (depth-preferred), so the expensive entries survive
+    def __init__(self, entries=1 << 16):
+        self.size = 1 << max(entries - 1, 0).bit_length() # rounded up to a power of two
+        self.keys = [None] * self.size
+        self.entries = [None] * self.size # (depth, value, bound)
+        self.hits = 0
+
+    def probe(self, key):
+        slot = key & (self.size - 1)
+        if self.keys[slot] == key:
+            self.hits += 1
+            return self.entries[slot]
+        return None
+
+    def store(self, key, depth, value, bound):
+        slot = key & (self.size - 1)
+        if self.keys[slot] is None or self.keys[slot] == key or self.entries[slot][0] <= depth:
+            self.keys[slot] = key
+            self.entries[slot] = (depth, value, bound)
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.entries = [None] * self.size
+        self.hits = 0
+
+class DominoesBitboard(object):
+
+    # a board as one int, bit r * cols + c set for a covered cell; a vertical domino at bit p
+    # also covers p + cols and a horizontal one p + 1, so every legal placement of a side is
+    # found at once with a shift and a mask, and counted with int.bit_count
+    # for a TranspositionTable a position carries four zobrist hashes, one per reflection
+    # of the board (none, left-right, up-down, both), each updated by one xor per move; the
+    # smallest is its key, so mirrored positions share an entry
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.full = (1 << (rows * cols)) - 1
+        # placements that stay on the board: not in the last row / not in the last column
+        self.vertical_mask = (1 << (max(rows - 1, 0) * cols)) - 1
+        row_mask = (1 << max(cols - 1, 0)) - 1
+        self.horizontal_mask = 0
+        for r in range(rows):
+            self.horizontal_mask |= row_mask << (r * cols)
+        self.covers = {
+            True: [(1 << p) | (1 << (p + cols)) for p in range(rows * cols)],
+            False: [(1 << p) | (1 << (p + 1)) for p in range(rows * cols)],
+        }
+        rng = random.Random(rows * 1000 + cols) # the same keys every run, so tables can be kept
+        zobrist = [rng.getrandbits(64) for p in range(rows * cols)]
+        self.cell_keys = []
+        for p in range(rows * cols):
+            r, c = divmod(p, cols)
+            mirrored = [(r, c), (r, cols - 1 - c), (rows - 1 - r, c), (rows - 1 - r, cols - 1 - c)]
+            self.cell_keys.append(tuple(zobrist[i * cols + j] for i, j in mirrored))
+        self.move_keys = {}
+        for vertical, step in ((True, cols), (False, 1)):
+            self.move_keys[vertical] = [None] * (rows * cols)
+            for p in range(rows * cols - step):
+                self.move_keys[vertical][p] = tuple(x ^ y for x, y in zip(self.cell_keys[p], self.cell_keys[p + step]))
+        # who is to move and whether that is the maximizing player
+        self.turn_keys = dict(((vertical, maximizing), rng.getrandbits(64)) for vertical in (True, False) for maximizing in (True, False))
+
+    def encode(self, board):
+        occupied = 0
+        for r, row in enumerate(board):
+            for c, cell in enumerate(row):
+                if cell:
+                    occupied |= 1 << (r * self.cols + c)
+        return occupied
+
+    def hashes(self, occupied):
+        hashes = [0, 0, 0, 0]
+        for p in range(self.rows * self.cols):
+            if occupied >> p & 1:
+                hashes = [h ^ k for h, k in zip(hashes, self.cell_keys[p])]
+        return tuple(hashes)
+
+    def moves(self, occupied, vertical):
+        # bit p set when the domino for vertical can go at p
+        free = self.full & ~occupied
+        if vertical:
+            return free & (free >> self.cols) & self.vertical_mask
+        return free & (free >> 1) & self.horizontal_mask
+
+    def order(self, mine, vertical, limit, root):
+        # the moves in mine as root.ordering ranks them, best last so they can be popped
+        moves = []
+        while mine:
+            low = mine & -mine
+            mine ^= low
+            moves.append(low.bit_length() - 1)
+        moves = root.ordering.order(moves, vertical, root.depth - limit)
+        moves.reverse()
+        return moves
+
+    # max_value and min_value mirror DominoesGame's: raster order (lowest bit first), the
+    # same cutoffs and the same leaf value, now two popcounts; with root.table set, inner
+    # nodes first look themselves up and store what they found, and with root.ordering set
+    # moves are tried in its order
+    # a table entry is only used at the depth it was searched to: the leaf value is not a
+    # game result, so a deeper search gives a different value rather than a better one
+
+    def max_value(self, occupied, vertical, limit, a, b, root, hashes=None):
+        ordering = root.ordering
+        if ordering is not None:
+            ply = root.depth - limit
+            ordering.enter(ply)
+        mine = self.moves(occupied, vertical)
+        if not mine or limit == 0:
+            root.leaves += 1
+            return mine.bit_count() - self.moves(occupied, not vertical).bit_count()
+        table = root.table
+        if table is not None:
+            key = min(hashes) ^ self.turn_keys[(vertical, True)]
+            entry = table.probe(key) if limit != root.depth else None # the root must pick a move
+            if entry is not None and entry[0] == limit:
+                depth, value, bound = entry
+                if bound == EXACT:
+                    return value
+                if bound == LOWER and value > a:
+                    a = value
+                elif bound == UPPER and value < b:
+                    b = value
+                if a >= b:
+                    return value
+            window = (a, b)
+        if root.stats is not None:
+            root.stats.nodes_expanded += 1
+        covers = self.covers[vertical]
+        move_keys = self.move_keys[vertical]
+        child_hashes = None
+        v = -math.inf
+        ordered = self.order(mine, vertical, limit, root) if ordering is not None else None
+        while mine:
+            # raster order (lowest bit first) unless ordered
+            if ordered is None:
+                low = mine & -mine
+                p = low.bit_length() - 1
+            else:
+                p = ordered.pop()
+                low = 1 << p
+            mine ^= low
+            if root.stats is not None:
+                root.stats.nodes_generated += 1
+            if table is not None:
+                child_hashes = tuple(h ^ k for h, k in zip(hashes, move_keys[p]))
+            v_prime = self.min_value(occupied | covers[p], not vertical, limit-1, a, b, root, child_hashes)
+            if v_prime > v:
+                v = v_prime
+                if root.depth - limit + 1 == 1:
+                    root.move = divmod(p, self.cols)
+                if ordering is not None:
+                    ordering.improve(ply, p)
+            if v >= b:
+                if ordering is not None:
+                    ordering.cutoff(ply, vertical, p, limit)
+                break
+            if v > a:
+                a = v
+        if table is not None:
+            table.store(key, limit, v, bound_type(v, window))
+        return v
+
+    def min_value(self, occupied, vertical, limit, a, b, root, hashes=None):
+        ordering = root.ordering
+        if ordering is not None:
+            ply = root.depth - limit
+            ordering.enter(ply)
+        mine = self.moves(occupied, vertical)
+        if not mine or limit == 0:
+            root.leaves += 1
+            return self.moves(occupied, not vertical).bit_count() - mine.bit_count()
+        table = root.table
+        if table is not None:
+            key = min(hashes) ^ self.turn_keys[(vertical, False)]
+            entry = table.probe(key)
+            if entry is not None and entry[0] == limit:
+                depth, value, bound = entry
+                if bound == EXACT:
+                    return value
+                if bound == LOWER and value > a:
+                    a = value
+                elif bound == UPPER and value < b:
+                    b = value
+                if a >= b:
+                    return value
+            window = (a, b)
+        if root.stats is not None:
+            root.stats.nodes_expanded += 1
+        covers = self.covers[vertical]
+        move_keys = self.move_keys[vertical]
+        child_hashes = None
+        v = math.inf
+        ordered = self.order(mine, vertical, limit, root) if ordering is not None else None
+        while mine:
+            # raster order (lowest bit first) unless ordered
+            if ordered is None:
+                low = mine & -mine
+                p = low.bit_length() - 1
+            else:
+                p = ordered.pop()
+                low = 1 << p
+            mine ^= low
+            if root.stats is not None:
+                root.stats.nodes_generated += 1
+            if table is not None:
+                child_hashes = tuple(h ^ k for h, k in zip(hashes, move_keys[p]))
+            v_prime = self.max_value(occupied | covers[p], not vertical, limit-1, a, b, root, child_hashes)
+            if v_prime < v:
+                v = v_prime
+                if ordering is not None:
+                    ordering.improve(ply, p)
+            if v <= a:
+                if ordering is not None:
+                    ordering.cutoff(ply, vertical, p, limit)
+                break
+            if v < b:
+                b = v
+        if table is not None:
+            table.store(key, limit, v, bound_type(v, window))
+        return v
+
+def bound_type(value, window):
+    # what a fail-soft alpha-beta value says about the true value, given the window searched
+    if value <= window[0]:
+        return UPPER
+    if value >= window[1]:
+        return LOWER
+    return EXACT
+
+dominoes_bitboards = {}
+
+def dominoes_bitboard(rows, cols):
+    # one engine per board shape, its masks built once
+    if (rows, cols) not in dominoes_bitboards:
+        dominoes_bitboards[(rows, cols)] = DominoesBitboard(rows, cols)
+    return dominoes_bitboards[(rows, cols)]
@@ -0,0 +1,195 @@
+############################################################
+# Imports
+############################################################
+
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import io
+import json
+import os
+import signal
+import sys
+import time
+
+############################################################
+# Section 1: Instances
+############################################################
+
+# one instance per JSONL line or CSV row, e.g.
+#   {"id": 1, "kind": "lights_out", "board": [[true, false], [false, false]]}
+#   {"id": 2, "kind": "tile_puzzle", "board": [[1, 2], [0, 3]]}
+#   {"id": 3, "kind": "disks", "length": 8, "n": 3}
+#   {"id": 4, "kind": "distinct_disks", "length": 8, "n": 3}
+# an optional "method" picks the solver mode; CSV cells are parsed as JSON when they can be
+# a line or row that cannot be read becomes a BadInstance, written out as an error result
+# without stopping the batch
+
+class BadInstance(object):
+
+    def __init__(self, line, error):
+        self.result = {"id": None, "kind": None, "line": line, "status": "error", "error": error}
+
+def read_jsonl(stream):
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            instance = json.loads(line)
+        except ValueError as e:
+            yield BadInstance(number, "%s: %s" % (type(e).__name__, e))
+            continue
+        if not isinstance(instance, dict):
+            yield BadInstance(number, "expected a JSON object, got %s" % type(instance).__name__)
+            continue
+        yield instance
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield BadInstance(reader.line_num, "%s: %s" % (type(e).__name__, e))
+            continue
+        instance = {}
+        for key, value in row.items():
+            try:
+                instance[key] = json.loads(value)
+            except (TypeError, ValueError):
+                instance[key] = value
+        yield instance
+
+def read_instances(stream, fmt):
+    if fmt == "csv":
+        return read_csv(stream)
+    return read_jsonl(stream)
+
+############################################################
+# Section 2: Solving
+############################################################
+
+class InstanceTimeout(Exception):
+    pass
+
+def raise_timeout(signum, frame):
+    raise InstanceTimeout()
+
+def solve_instance(instance):
+    kind = instance["kind"]
+    method = instance.get("method")
+    if kind == "lights_out":
+        import uninformed_search
+        return uninformed_search.LightsOutPuzzle(instance["board"]).find_solution(method or "gf2")
+    if kind == "tile_puzzle":
+        import informed_search
+        puzzle = informed_search.TilePuzzle(instance["board"])
+        if method == "iddfs":
+            return next(puzzle.find_solutions_iddfs())
+        return puzzle.find_solution_a_star()
+    if kind == "disks":
+        import uninformed_search
+        return uninformed_search.solve_identical_disks(instance["length"], instance["n"], method != "bfs")
+    if kind == "distinct_disks":
+        import uninformed_search
+        with contextlib.redirect_stdout(io.StringIO()): # solve_distinct_disks prints its arguments
+            return uninformed_search.solve_distinct_disks(instance["length"], instance["n"], method != "bfs")
+    raise ValueError("unknown kind: %r" % (kind,))
+
+def run_instance(instance, timeout):
+    # runs in a worker process; the timeout is enforced there with SIGALRM so a slow
+    # instance fails on its own without taking the worker down
+    result = {"id": instance.get("id"), "kind": instance.get("kind")}
+    alarm = timeout and hasattr(signal, "setitimer")
+    started = time.perf_counter()
+    try:
+        if alarm:
+            signal.signal(signal.SIGALRM, raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            result["solution"] = solve_instance(instance)
+            result["status"] = "ok"
+        finally:
+            if alarm:
+                # a signal already delivered is dropped rather than raised later
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    except InstanceTimeout:
+        if "status" not in result: # the alarm may go off just after the solve returned
+            result["status"] = "timeout"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    result["time"] = time.perf_counter() - started
+    return result
+
+def solve_stream(instances, output, workers=None, max_in_flight=None, timeout=None):
+    # at most max_in_flight instances are read ahead of the results, so memory stays flat
+    # however long the input is; results are written as they complete, not in input order
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = {} # future -> its instance's id and kind
+        done_count = 0
+        for instance in instances:
+            if isinstance(instance, BadInstance):
+                output.write(json.dumps(instance.result) + "\n")
+                done_count += 1
+                continue
+            if len(pending) >= max_in_flight:
+                done, not_done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                done_count += write_results(done, pending, output)
+            try:
+                future = pool.submit(run_instance, instance, timeout)
+            except concurrent.futures.process.BrokenProcessPool:
+                # a worker died; the instances it took down fail on their own in write_results,
+                # the rest of the batch goes to a fresh pool
+                pool.shutdown(wait=False)
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+                future = pool.submit(run_instance, instance, timeout)
+            pending[future] = (instance.get("id"), instance.get("kind"))
+        done, not_done = concurrent.futures.wait(pending)
+        done_count += write_results(done, pending, output)
+    finally:
+        pool.shutdown()
+    return done_count
+
+def write_results(futures, pending, output):
+    # a future that failed outright (a worker killed, an unpicklable result) still gets
+    # an error line, so one instance never ends the run
+    for future in futures:
+        instance_id, kind = pending.pop(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"id": instance_id, "kind": kind, "status": "error", "error": "%s: %s" % (type(e).__name__, e)}
+        output.write(json.dumps(result) + "\n")
+    output.flush()
+    return len(futures)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve a stream of puzzle instances with a process pool.")
+    parser.add_argument("input", help="JSONL or CSV file of instances, - for stdin")
+    parser.add_argument("output", nargs="?", default="-", help="JSONL file of results, - for stdout")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="input format (default: from the file name)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per cpu)")
+    parser.add_argument("--in-flight", type=int, help="instances submitted but not yet written (default: 2 per worker)")
+    parser.add_argument("--timeout", type=float, help="seconds allowed per instance")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.input.endswith(".csv") else "jsonl")
+    with contextlib.ExitStack() as stack:
+        stream = sys.stdin if args.input == "-" else stack.enter_context(open(args.input, newline=""))
+        output = sys.stdout if args.output == "-" else stack.enter_context(open(args.output, "w"))
+        solve_stream(read_instances(stream, fmt), output, args.workers, args.in_flight, args.timeout)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+############################################################
+# Imports
+############################################################
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+############################################################
+# Section 1: Workloads
+############################################################
+
+# every workload is a function of a random.Random that returns a list of zero-argument
+# callables; each callable is one timed call, built from the seed so runs are comparable
+
+def n_queens_workload(rng):
+    import uninformed_search
+    return [lambda n=n: uninformed_search.n_queens_solutions(n, "count") for n in (8, 9, 10)]
+
+def scrambled_lights_out(rng, rows, cols):
+    import uninformed_search
+    puzzle = uninformed_search.create_puzzle(rows, cols)
+    for i in range(rows):
+        for j in range(cols):
+            if rng.random() < 0.5:
+                puzzle.perform_move(i, j)
+    return puzzle.get_board()
+
+def lights_out_workload(rng):
+    import uninformed_search
+    boards = [scrambled_lights_out(rng, 3, 3) for i in range(5)]
+    return [lambda board=board: uninformed_search.LightsOutPuzzle([list(row) for row in board]).find_solution("bfs") for board in boards]
+
+def lights_out_gf2_workload(rng):
+    import uninformed_search
+    boards = [scrambled_lights_out(rng, 20, 20) for i in range(5)]
+    return [lambda board=board: uninformed_search.LightsOutPuzzle([list(row) for row in board]).find_solution("gf2") for board in boards]
+
+def tile_puzzle_workload(rng):
+    import informed_search
+    boards = []
+    for i in range(5):
+        puzzle = informed_search.create_tile_puzzle(3, 3)
+        for j in range(30):
+            puzzle.perform_move(rng.choice(["up", "down", "left", "right"]))
+        boards.append(puzzle.get_board())
+    return [lambda board=board: informed_search.TilePuzzle([list(row) for row in board]).find_solution_a_star() for board in boards]
+
+def random_scene(rng, rows, cols, density):
+    scene = [[rng.random() < density for j in range(cols)] for i in range(rows)]
+    scene[0][0] = False
+    scene[-1][-1] = False
+    return scene
+
+def grid_nav_workload(rng):
+    import informed_search
+    scenes = [random_scene(rng, 30, 30, 0.25) for i in range(5)]
+    return [lambda scene=scene: informed_search.find_path((0, 0), (29, 29), scene) for scene in scenes]
+
+def disk_workload(rng):
+    import uninformed_search
+    return [lambda: uninformed_search.solve_identical_disks(8, 3), lambda: uninformed_search.solve_distinct_disks(6, 3)]
+
+def dominoes_workload(rng):
+    import adverserial_search
+    calls = []
+    for limit in (1, 2, 3):
+        calls.append(lambda limit=limit: adverserial_search.create_dominoes_game(4, 4).get_best_move(True, limit))
+    return calls
+
+SUDOKU = [
+    "53**7****",
+    "6**195***",
+    "*98****6*",
+    "8***6***3",
+    "4**8*3**1",
+    "7***2***6",
+    "*6****28*",
+    "***419**5",
+    "****8**79",
+]
+
+def sudoku_workload(rng):
+    import constraint_satisfaction
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sudoku.txt")
+        with open(path, "w") as f:
+            f.write("\n".join(SUDOKU) + "\n")
+        board = constraint_satisfaction.read_board(path)
+    # infer_improved narrows the board in place, so every call gets a fresh copy
+    return [lambda: constraint_satisfaction.Sudoku(dict((cell, set(values)) for cell, values in board.items())).infer_improved()]
+
+class GridWorld(object):
+
+    # small stochastic gridworld with the interface the mdp and rl agents expect
+    def __init__(self, rows, cols, rng):
+        self.rows = rows
+        self.cols = cols
+        self.walls = set((rng.randrange(rows), rng.randrange(cols)) for i in range(rows * cols // 6))
+        self.goal = (rows - 1, cols - 1)
+        self.walls.discard(self.goal)
+        self.walls.discard((0, 0))
+        self.states = [(i, j) for i in range(rows) for j in range(cols) if (i, j) not in self.walls] + ["done"]
+
+    def get_actions(self, state):
+        if state == "done":
+            return ("stay",)
+        if state == self.goal:
+            return ("exit",)
+        return ("up", "down", "left", "right")
+
+    def move(self, state, action):
+        i, j = state
+        di, dj = {"up": (-1, 0), "down": (1, 0), "left": (0, -1), "right": (0, 1)}[action]
+        if 0 <= i + di < self.rows and 0 <= j + dj < self.cols and (i + di, j + dj) not in self.walls:
+            return (i + di, j + dj)
+        return state
+
+    def get_transitions(self, state, action):
+        if action in ("stay", "exit"):
+            return {"done": 1.0}
+        transitions = {}
+        for outcome, prob in ((action, 0.8), ({"up": "left", "down": "right", "left": "down", "right": "up"}[action], 0.2)):
+            next_state = self.move(state, outcome)
+            transitions[next_state] = transitions.get(next_state, 0) + prob
+        return transitions
+
+    def get_reward(self, state, action, next_state):
+        if action == "exit":
+            return 1.0
+        return -0.01
+
+def mdp_workload(rng):
+    import markov_decision_process
+    game = GridWorld(8, 8, rng)
+    def run(agent_class):
+        agent = agent_class(game, 0.9)
+        for i in range(10):
+            agent.iterate()
+    return [lambda: run(markov_decision_process.ValueIterationAgent), lambda: run(markov_decision_process.PolicyIterationAgent)]
+
+def rl_workload(rng):
+    import reinforcement_learning
+    game = GridWorld(6, 6, rng)
+    def run(seed):
+        random.seed(seed)
+        agent = reinforcement_learning.QLearningAgent(game, 0.9, 0.5, 0.2)
+        for episode in range(50):
+            state = (0, 0)
+            for step in range(100):
+                action = agent.get_action(state)
+                transitions = game.get_transitions(state, action)
+                next_state = random.choices(list(transitions), list(transitions.values()))[0]
+                agent.update(state, action, next_state, game.get_reward(state, action, next_state))
+                if next_state == "done":
+                    break
+                state = next_state
+    return [lambda seed=seed: run(seed) for seed in range(3)]
+
+WORKLOADS = {
+    "n_queens": n_queens_workload,
+    "lights_out": lights_out_workload,
+    "lights_out_gf2": lights_out_gf2_workload,
+    "tile_puzzle": tile_puzzle_workload,
+    "grid_nav": grid_nav_workload,
+    "disks": disk_workload,
+    "dominoes": dominoes_workload,
+    "sudoku": sudoku_workload,
+    "mdp": mdp_workload,
+    "rl": rl_workload,
+}
+
+############################################################
+# Section 2: Runner
+############################################################
+
+LATENCIES = [("p50", 0.5), ("p90", 0.9), ("p99", 0.99)]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def latencies_of(values):
+    return dict((key, percentile(values, fraction)) for key, fraction in LATENCIES)
+
+def calibrate(repeat=5):
+    # rate of a fixed pure-python loop; measured next to each workload so compare can
+    # tell a slower machine (a busy host, a throttled cpu) from slower code
+    best = 0
+    for i in range(repeat):
+        started = time.perf_counter()
+        counts = {}
+        for k in range(50000):
+            counts[k & 1023] = counts.get(k & 1023, 0) + k
+        best = max(best, 1 / (time.perf_counter() - started))
+    return best
+
+def run_workload(name, seed, repeat, warmup=1, min_time=1.0):
+    # runs in a fresh process so peak rss belongs to this workload alone; warmup rounds
+    # are not timed, then rounds of every call repeat at least repeat times and until
+    # min_time seconds have passed, so quick workloads still get enough samples
+    # throughput is the median over rounds and best the fastest round; best is what
+    # compare checks, since noise from the rest of the machine only ever slows a round down
+    with contextlib.redirect_stdout(io.StringIO()): # some solvers print as they go
+        calls = WORKLOADS[name](random.Random(seed))
+        for i in range(warmup):
+            for call in calls:
+                call()
+        latencies = [[] for call in calls]
+        rounds = []
+        calibration = calibrate()
+        started = time.perf_counter()
+        while len(rounds) < repeat or time.perf_counter() - started < min_time:
+            round_started = time.perf_counter()
+            for i, call in enumerate(calls):
+                t = time.perf_counter()
+                call()
+                latencies[i].append(time.perf_counter() - t)
+            rounds.append(len(calls) / (time.perf_counter() - round_started))
+        calibration = max(calibration, calibrate())
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin": # bytes there, kilobytes on linux
+        peak //= 1024
+    result = {
+        "calls": sum(len(samples) for samples in latencies),
+        "throughput": percentile(rounds, 0.5),
+        "best": max(rounds),
+        "per_call": [latencies_of(samples) for samples in latencies],
+        "peak_rss_kb": peak,
+        "calibration": calibration,
+    }
+    result.update(latencies_of([t for samples in latencies for t in samples]))
+    return result
+
+@contextlib.contextmanager
+def hash_seed(seed):
+    # processes spawned inside the block get PYTHONHASHSEED=seed; the caller's environment
+    # is put back afterwards
+    previous = os.environ.get("PYTHONHASHSEED")
+    os.environ["PYTHONHASHSEED"] = str(seed)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["PYTHONHASHSEED"]
+        else:
+            os.environ["PYTHONHASHSEED"] = previous
+
+def run_benchmarks(names, seed=0, repeat=3, warmup=1, min_time=1.0, processes=3):
+    # every workload runs in processes fresh processes in turn; a process can be slower
+    # throughout (memory layout, a busy neighbor), so the fastest process gives best and
+    # the others' medians are averaged out by taking the median of them
+    # a fixed hash seed keeps set and dict order, and so the work some solvers do, the same
+    # in every process
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in names:
+        runs = []
+        for i in range(processes):
+            with hash_seed(seed), context.Pool(1) as pool:
+                runs.append(pool.apply(run_workload, (name, seed, repeat, warmup, min_time)))
+        result = {"calls": sum(run["calls"] for run in runs), "best": max(run["best"] for run in runs),
+                  "calibration": max(run["calibration"] for run in runs)}
+        for key in ["throughput"] + [key for key, fraction in LATENCIES]:
+            result[key] = percentile([run[key] for run in runs], 0.5)
+        result["per_call"] = [dict((key, percentile([run["per_call"][i][key] for run in runs], 0.5))
+                                   for key, fraction in LATENCIES) for i in range(len(runs[0]["per_call"]))]
+        result["peak_rss_kb"] = max(run["peak_rss_kb"] for run in runs)
+        results[name] = result
+    return {
+        "python": platform.python_version(),
+        "seed": seed,
+        "repeat": repeat,
+        "warmup": warmup,
+        "min_time": min_time,
+        "processes": processes,
+        "workloads": results,
+    }
+
+def compare(current, baseline, tolerance, min_seconds=0.001, min_kb=1024):
+    # a regression is a drop in best-round throughput or a rise in memory beyond tolerance
+    # that is also more than min_seconds per call (min_kb of memory), so noise on quick
+    # calls is not flagged; latency percentiles are compared call by call, since a
+    # workload's calls can differ a lot in size and the mixed percentiles hide a change in
+    # one of them (the workload-wide ones are reported only)
+    # the baseline is scaled by how fast the calibration loop ran then and now, so a
+    # machine that is slower as a whole does not show up as a regression
+    regressions = []
+    for name, now in current["workloads"].items():
+        before = baseline["workloads"].get(name)
+        if before is None:
+            continue
+        scale = 1.0
+        if "calibration" in before:
+            scale = min(1.0, now["calibration"] / before["calibration"])
+        best_before = before.get("best", before["throughput"]) * scale # baselines saved before best existed
+        if now["best"] < best_before * (1 - tolerance) and 1 / now["best"] - 1 / best_before > min_seconds:
+            regressions.append((name, "best", best_before, now["best"]))
+        per_call = before.get("per_call", [])
+        if len(per_call) == len(now["per_call"]): # otherwise the workload changed and calls do not line up
+            for i, (then, latest) in enumerate(zip(per_call, now["per_call"])):
+                for key, fraction in LATENCIES:
+                    limit = then[key] / scale
+                    if latest[key] > limit * (1 + tolerance) and latest[key] - limit > min_seconds:
+                        regressions.append((name, "call %d %s" % (i, key), limit, latest[key]))
+        if now["peak_rss_kb"] > before["peak_rss_kb"] * (1 + tolerance) and now["peak_rss_kb"] - before["peak_rss_kb"] > min_kb:
+            regressions.append((name, "peak_rss_kb", before["peak_rss_kb"], now["peak_rss_kb"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every solver on fixed-seed workloads.")
+    parser.add_argument("workloads", nargs="*", help="workloads to run (default: all of %s)" % ", ".join(WORKLOADS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="least times each workload's calls are repeated")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed rounds before timing (default 1)")
+    parser.add_argument("--min-time", type=float, default=1.0, help="least seconds of timed rounds per workload (default 1.0)")
+    parser.add_argument("--processes", type=int, default=3, help="fresh processes each workload runs in (default 3)")
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--baseline", help="compare against this json file and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown (default 0.10)")
+    parser.add_argument("--min-seconds", type=float, default=0.001, help="smallest per-call slowdown flagged (default 0.001)")
+    args = parser.parse_args(argv)
+
+    names = args.workloads or list(WORKLOADS)
+    for name in names:
+        if name not in WORKLOADS:
+            parser.error("unknown workload: %s" % name)
+
+    results = run_benchmarks(names, args.seed, args.repeat, args.warmup, args.min_time, args.processes)
+    for name, result in results["workloads"].items():
+        print("%-16s %10.1f calls/s  p50 %9.4fs  p90 %9.4fs  p99 %9.4fs  rss %8d kB" % (
+            name, result["throughput"], result["p50"], result["p90"], result["p99"], result["peak_rss_kb"]))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            # a regression has to show up twice: flagged workloads run again in twice as many
+            # processes and keep their better numbers, so one slow stretch of the machine
+            # cannot fail the check
+            again = run_benchmarks(sorted(set(name for name, key, before, now in regressions)),
+                                   args.seed, args.repeat, args.warmup, args.min_time, 2 * args.processes)
+            for name, result in again["workloads"].items():
+                first = results["workloads"][name]
+                calibration = first["calibration"]
+                if result["best"] / result["calibration"] > first["best"] / first["calibration"]:
+                    first["best"], first["calibration"] = result["best"], result["calibration"]
+                # a latency times the calibration rate is work, which is comparable across runs
+                for mine, theirs in zip(first["per_call"], result["per_call"]):
+                    for key, fraction in LATENCIES:
+                        mine[key] = min(mine[key] * calibration, theirs[key] * result["calibration"]) / first["calibration"]
+                first["peak_rss_kb"] = min(first["peak_rss_kb"], result["peak_rss_kb"])
+            regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        for name, key, before, now in regressions:
+            print("REGRESSION %s %s: %.6g -> %.6g" % (name, key, before, now))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,875 @@
+############################################################
+# Imports
+############################################################
+
+import collections
+import heapq
+import math
+import mmap
+import pickle
+from array import array
+
+from informed_search import GridMap, grid_map, grid_a_star, octile, SQRT2
+from search import atomic_pickle
+from search_stats import timed
+
+############################################################
+# Section 1: Bounded Search
+############################################################
+
+class LocalGrid(object):
+
+    # a copy of one rectangle of a GridMap, (first_row, last_row, first_col, last_col)
+    # inclusive, with its own blocked border, so a search inside it needs no bounds checks
+    def __init__(self, grid, bounds):
+        first_row, last_row, first_col, last_col = bounds
+        self.grid = grid
+        self.first_row = first_row
+        self.first_col = first_col
+        self.width = last_col - first_col + 3
+        span = last_col - first_col + 1
+        self.cells = bytearray(b"\x01") * (self.width * (last_row - first_row + 3))
+        for row in range(first_row, last_row + 1):
+            source = grid.cell_id((row, first_col))
+            local = (row - first_row + 1) * self.width + 1
+            self.cells[local:local + span] = grid.cells[source:source + span]
+        w = self.width
+        self.offsets = ((-w, 1), (w, 1), (-1, 1), (1, 1),
+                        (-w - 1, SQRT2), (-w + 1, SQRT2), (w - 1, SQRT2), (w + 1, SQRT2))
+
+    def local(self, cell):
+        row, col = self.grid.location(cell)
+        return (row - self.first_row + 1) * self.width + col - self.first_col + 1
+
+    def cell(self, local):
+        row, col = divmod(local, self.width)
+        return self.grid.cell_id((row - 1 + self.first_row, col - 1 + self.first_col))
+
+    def search(self, source, target=None, targets=None, paths=False):
+        # A* (Dijkstra when target is None) between GridMap cell ids inside the rectangle
+        # returns (path, cost) for a target, or {cell: cost} for the cells in targets,
+        # {cell: (cost, path)} with paths
+        cells = self.cells
+        width = self.width
+        start = self.local(source)
+        goal = self.local(target) if target is not None else None
+        wanted = {}
+        if targets is not None:
+            for cell in targets:
+                wanted[self.local(cell)] = cell
+        if goal is not None:
+            goal_row, goal_col = divmod(goal, width)
+        g = [math.inf] * len(cells)
+        parent = {start: None}
+        g[start] = 0.0
+        closed = bytearray(len(cells))
+        found = {}
+        frontier = [(0.0, start)]
+        while frontier:
+            f, cell = heapq.heappop(frontier)
+            if closed[cell]:
+                continue
+            closed[cell] = 1
+            if cell == goal:
+                path = []
+                while cell is not None:
+                    path.append(self.cell(cell))
+                    cell = parent[cell]
+                path.reverse()
+                return path, g[goal]
+            if cell in wanted:
+                found[wanted[cell]] = g[cell]
+                if len(found) == len(wanted):
+                    break
+            base = g[cell]
+            for offset, cost in self.offsets:
+                child = cell + offset
+                if cells[child] or closed[child]:
+                    continue
+                new_g = base + cost
+                if new_g < g[child]:
+                    g[child] = new_g
+                    parent[child] = cell
+                    if goal is not None:
+                        row, col = divmod(child, width)
+                        new_g = round(new_g + octile(row - goal_row, col - goal_col), 9)
+                    heapq.heappush(frontier, (new_g, child))
+        if goal is not None:
+            return None, math.inf
+        if paths:
+            for cell, cost in found.items():
+                path = []
+                local = self.local(cell)
+                while local is not None:
+                    path.append(self.cell(local))
+                    local = parent[local]
+                path.reverse()
+                found[cell] = (cost, path)
+        return found
+
+############################################################
+# Section 2: Hierarchical Pathfinding (HPA*)
+############################################################
+
+class HierarchicalGridNav(object):
+
+    # HPA*: the scene is cut into cluster_size square clusters; entrances are placed on the
+    # free runs along every shared border (one in the middle of a short run, one at each end
+    # of a run of six or more), linked across the border at cost 1 and to each other inside
+    # their cluster at their true distance
+    # a second level groups group x group clusters into blocks: the entrances on block
+    # borders are its nodes, linked inside their block at their distance in the first-level
+    # graph, so a long query only searches the first level inside the blocks of its ends
+    # building costs a bounded dijkstra per entrance and is done once per scene (save it and
+    # load_hierarchical_grid_nav it elsewhere); the path behind every link inside a cluster
+    # is kept as one byte per step and behind every block link as its first-level nodes,
+    # so a query links start and goal into their clusters and blocks, searches the small
+    # top graph and unpacks the stored paths; ends within two clusters of each other are
+    # searched directly on the grid around them
+    # paths are near-optimal: routes have to cross cluster borders at entrances
+    def __init__(self, scene, cluster_size=16, group=8):
+        self.grid = grid_map(scene)
+        self.cluster_size = cluster_size
+        self.group = group
+        self.edges = {} # abstract node (cell id) -> {neighbor: cost}
+        self.cluster_nodes = {} # (cluster row, cluster col) -> [cell ids]
+        self.paths = {} # (a, b) -> the steps from a to b inside a cluster, offset indices as bytes
+        self.locals = {} # bounds -> their LocalGrid, made on first use
+        self.steps = dict((offset, code) for code, (offset, cost) in enumerate(self.grid.offsets))
+        self.positions = {} # abstract node -> (row, col)
+        self.build_entrances()
+        for cluster, nodes in self.cluster_nodes.items():
+            local = self.local_grid(self.bounds(cluster))
+            for node in nodes:
+                found = local.search(node, targets=nodes, paths=True)
+                for other, (cost, path) in found.items():
+                    if other != node:
+                        self.link(node, other, cost, path)
+        self.locals = {} # a query only needs the clusters of its start and goal
+        self.build_blocks()
+
+    def __getstate__(self):
+        return {
+            "rows": self.grid.rows,
+            "cols": self.grid.cols,
+            "cells": bytes(self.grid.cells),
+            "cluster_size": self.cluster_size,
+            "group": self.group,
+            "edges": self.edges,
+            "cluster_nodes": self.cluster_nodes,
+            "paths": self.paths,
+            "top_edges": self.top_edges,
+            "top_paths": self.top_paths,
+        }
+
+    def __setstate__(self, state):
+        self.grid = GridMap(state["rows"], state["cols"], bytearray(state["cells"]))
+        self.cluster_size = state["cluster_size"]
+        self.group = state["group"]
+        self.edges = state["edges"]
+        self.cluster_nodes = state["cluster_nodes"]
+        self.paths = state["paths"]
+        self.top_edges = state["top_edges"]
+        self.top_paths = state["top_paths"]
+        self.locals = {}
+        self.steps = dict((offset, code) for code, (offset, cost) in enumerate(self.grid.offsets))
+        self.positions = dict((node, self.grid.location(node)) for node in self.edges)
+        self.index_blocks()
+
+    def save(self, path):
+        atomic_pickle(self, path)
+
+    def local_grid(self, bounds):
+        if bounds not in self.locals:
+            if len(self.locals) >= 64: # queries touch few clusters; keep the cache small
+                self.locals.clear()
+            self.locals[bounds] = LocalGrid(self.grid, bounds)
+        return self.locals[bounds]
+
+    def pack(self, path):
+        return bytes(self.steps[b - a] for a, b in zip(path, path[1:]))
+
+    def unpack(self, cell, steps):
+        offsets = self.grid.offsets
+        path = [cell]
+        for code in steps:
+            cell += offsets[code][0]
+            path.append(cell)
+        return path
+
+    def cluster(self, cell):
+        row, col = self.positions.get(cell) or self.grid.location(cell)
+        return (row // self.cluster_size, col // self.cluster_size)
+
+    def block(self, cell):
+        row, col = self.positions.get(cell) or self.grid.location(cell)
+        size = self.cluster_size * self.group
+        return (row // size, col // size)
+
+    def bounds(self, cluster):
+        k = self.cluster_size
+        return (cluster[0] * k, min((cluster[0] + 1) * k, self.grid.rows) - 1,
+                cluster[1] * k, min((cluster[1] + 1) * k, self.grid.cols) - 1)
+
+    def link(self, a, b, cost, path=None):
+        # path, a list of cell ids from a to b, is kept for links inside a cluster
+        if cost < self.edges.setdefault(a, {}).get(b, math.inf):
+            self.edges[a][b] = cost
+            if path is not None:
+                self.paths[(a, b)] = self.pack(path)
+                self.paths.pop((b, a), None)
+        if cost < self.edges.setdefault(b, {}).get(a, math.inf):
+            self.edges[b][a] = cost
+
+    def add_node(self, cell):
+        if cell not in self.edges:
+            self.edges[cell] = {}
+            self.positions[cell] = self.grid.location(cell)
+            self.cluster_nodes.setdefault(self.cluster(cell), []).append(cell)
+
+    def add_entrance(self, a, b, cost=1):
+        self.add_node(a)
+        self.add_node(b)
+        self.link(a, b, cost)
+
+    def build_entrances(self):
+        grid = self.grid
+        k = self.cluster_size
+        # borders between vertically adjacent clusters: row r over row r + 1
+        for r in range(k - 1, grid.rows - 1, k):
+            self.scan_border([(grid.cell_id((r, c)), grid.cell_id((r + 1, c))) for c in range(grid.cols)])
+        # borders between horizontally adjacent clusters: col c beside col c + 1
+        for c in range(k - 1, grid.cols - 1, k):
+            self.scan_border([(grid.cell_id((r, c)), grid.cell_id((r, c)) + 1) for r in range(grid.rows)])
+
+    def scan_border(self, pairs):
+        # pairs of facing cells along one border line, split where clusters end
+        cells = self.grid.cells
+        k = self.cluster_size
+        for first in range(0, len(pairs), k):
+            run = []
+            for a, b in pairs[first:first + k] + [(None, None)]:
+                if a is not None and not cells[a] and not cells[b]:
+                    run.append((a, b))
+                    continue
+                if len(run) >= 6:
+                    self.add_entrance(*run[0])
+                    self.add_entrance(*run[-1])
+                elif run:
+                    self.add_entrance(*run[len(run) // 2])
+                run = []
+        # a diagonal step across the border is only needed where neither of its cells can
+        # cross straight; this also covers steps through the corner shared by four clusters
+        for i in range(len(pairs) - 1):
+            (a, b), (next_a, next_b) = pairs[i], pairs[i + 1]
+            if cells[b] and cells[next_a]:
+                if not cells[a] and not cells[next_b]:
+                    self.add_entrance(a, next_b, SQRT2)
+            if cells[a] and cells[next_b]:
+                if not cells[next_a] and not cells[b]:
+                    self.add_entrance(next_a, b, SQRT2)
+
+    def index_blocks(self):
+        self.block_members = {} # block -> its first-level nodes
+        self.block_tops = {} # block -> its second-level nodes
+        for node in self.edges:
+            self.block_members.setdefault(self.block(node), set()).add(node)
+        for node in self.top_edges:
+            self.block_tops.setdefault(self.block(node), set()).add(node)
+
+    def build_blocks(self):
+        # second level: nodes on block borders, linked inside their block by dijkstra over
+        # the first-level graph kept to that block
+        self.top_edges = {}
+        self.top_paths = {} # (a, b) -> first-level nodes from a to b inside a block
+        for node, links in self.edges.items():
+            for other, cost in links.items():
+                if self.block(node) != self.block(other):
+                    self.top_edges.setdefault(node, {})[other] = cost
+        self.index_blocks()
+        for block, nodes in self.block_tops.items():
+            inside = self.block_members[block]
+            for node in nodes:
+                distances, parents = self.block_dijkstra({node: 0.0}, inside, nodes)
+                for other in nodes:
+                    if other == node or other not in distances:
+                        continue
+                    cost = distances[other]
+                    if cost >= self.top_edges[node].get(other, math.inf):
+                        continue
+                    path = [other]
+                    while parents[path[-1]] is not None:
+                        path.append(parents[path[-1]])
+                    # a path through another second-level node is already covered by that
+                    # node's two links, so leaving it out keeps the top graph sparse
+                    if any(step in nodes for step in path[1:-1]):
+                        continue
+                    path.reverse()
+                    self.top_edges[node][other] = cost
+                    self.top_edges[other][node] = cost
+                    self.top_paths[(node, other)] = array("q", path)
+                    self.top_paths.pop((other, node), None)
+
+    def block_dijkstra(self, sources, inside, targets, extra=None):
+        # first-level dijkstra from sources ({node: cost}) over the nodes in inside (those of
+        # one block), until every target is settled; extra adds links out of nodes not in
+        # the graph (an end being linked in); returns distances and parents (None at a source)
+        edges = self.edges
+        distances = {}
+        parents = dict((node, None) for node in sources)
+        best = dict(sources)
+        frontier = [(cost, node) for node, cost in sources.items()]
+        heapq.heapify(frontier)
+        remaining = len(targets)
+        while frontier and remaining:
+            cost, node = heapq.heappop(frontier)
+            if node in distances:
+                continue
+            distances[node] = cost
+            if node in targets:
+                remaining -= 1
+            links = edges.get(node)
+            if links is None:
+                links = extra[node]
+            for other, step in links.items():
+                if other in distances or other not in inside:
+                    continue
+                new_cost = cost + step
+                if new_cost < best.get(other, math.inf):
+                    best[other] = new_cost
+                    parents[other] = node
+                    heapq.heappush(frontier, (new_cost, other))
+        return distances, parents
+
+    def find_path(self, start, goal, stats=None):
+        grid = self.grid
+        if grid.is_blocked(start) or grid.is_blocked(goal):
+            return None
+        source = grid.cell_id(start)
+        target = grid.cell_id(goal)
+        with timed(stats):
+            return self.query(source, target, stats)
+
+    def query(self, source, target, stats):
+        grid = self.grid
+        (a_row, a_col), (b_row, b_col) = self.cluster(source), self.cluster(target)
+        if abs(a_row - b_row) <= 2 and abs(a_col - b_col) <= 2:
+            # ends within two clusters: A* on the grid around them (one cluster of margin),
+            # which also catches short paths that would detour through an entrance
+            first = self.bounds((max(0, min(a_row, b_row) - 1), max(0, min(a_col, b_col) - 1)))
+            last = self.bounds((min(max(a_row, b_row) + 1, (grid.rows - 1) // self.cluster_size),
+                                min(max(a_col, b_col) + 1, (grid.cols - 1) // self.cluster_size)))
+            path, cost = LocalGrid(grid, (first[0], last[1], first[2], last[3])).search(source, target)
+            if path is not None:
+                return [grid.location(cell) for cell in path]
+        # temporary links from start and goal into their clusters
+        extra = {} # start or goal -> {node: cost}
+        temporary = {} # (start or goal, node) -> path
+        for cell in (source, target):
+            if cell in self.edges:
+                continue
+            nodes = self.cluster_nodes.get(self.cluster(cell), [])
+            found = self.local_grid(self.bounds(self.cluster(cell))).search(cell, targets=nodes, paths=True)
+            extra[cell] = dict((node, cost) for node, (cost, path) in found.items())
+            for node, (cost, path) in found.items():
+                temporary[(cell, node)] = path
+        if abs(self.block(source)[0] - self.block(target)[0]) <= 1 and abs(self.block(source)[1] - self.block(target)[1]) <= 1:
+            nodes = self.graph_search(self.edges, source, target, extra, stats)
+        else:
+            nodes = self.top_query(source, target, extra, stats)
+        if nodes is None:
+            return None
+        return self.refine(nodes, temporary)
+
+    def top_query(self, source, target, extra, stats):
+        # link start and goal to the second-level nodes of their blocks through the first
+        # level, search the top graph, and expand its links back into first-level nodes
+        links = {}
+        chains = {} # (start or goal, top node) -> first-level nodes between them
+        for cell in (source, target):
+            block = self.block(cell)
+            nodes = self.block_tops.get(block, set())
+            distances, parents = self.block_dijkstra({cell: 0.0}, self.block_members.get(block, set()), nodes, extra)
+            links[cell] = {}
+            for node in nodes:
+                if node in distances and node != cell:
+                    links[cell][node] = distances[node]
+                    chain = [node]
+                    while parents[chain[-1]] is not None:
+                        chain.append(parents[chain[-1]])
+                    chain.reverse()
+                    chains[(cell, node)] = chain
+        top = self.graph_search(self.top_edges, source, target, links, stats)
+        if top is None:
+            return None
+        nodes = [top[0]]
+        for a, b in zip(top, top[1:]):
+            if (a, b) in chains:
+                nodes.extend(chains[(a, b)][1:])
+            elif (b, a) in chains:
+                nodes.extend(chains[(b, a)][-2::-1])
+            elif (a, b) in self.top_paths:
+                nodes.extend(self.top_paths[(a, b)][1:])
+            elif (b, a) in self.top_paths:
+                nodes.extend(self.top_paths[(b, a)][-2::-1])
+            else: # a link across a block border
+                nodes.append(b)
+        return nodes
+
+    def graph_search(self, edges, source, target, extra, stats):
+        # A* over an abstract graph plus extra links ({start or goal: {node: cost}}, used
+        # both ways); returns the nodes from source to target, or None
+        grid = self.grid
+        positions = self.positions
+        back = {}
+        for cell, links in extra.items():
+            for node, cost in links.items():
+                back.setdefault(node, {})[cell] = cost
+        goal_row, goal_col = positions.get(target) or grid.location(target)
+        estimates = {} # node -> its octile distance to target, worked out once per query
+        g = {source: 0.0}
+        parent = {source: None}
+        closed = set()
+        frontier = [(0.0, source)]
+        empty = {}
+        while frontier:
+            f, node = heapq.heappop(frontier)
+            if node in closed:
+                continue
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parent[node]
+                path.reverse()
+                return path
+            closed.add(node)
+            if stats is not None:
+                stats.nodes_expanded += 1
+                stats.frontier(len(frontier) + 1)
+            base = g[node]
+            for links in (edges.get(node, empty), extra.get(node, empty), back.get(node, empty)):
+                for other, cost in links.items():
+                    if stats is not None:
+                        stats.nodes_generated += 1
+                    new_g = base + cost
+                    if other in closed or new_g >= g.get(other, math.inf):
+                        continue
+                    g[other] = new_g
+                    parent[other] = node
+                    h = estimates.get(other)
+                    if h is None:
+                        row, col = positions.get(other) or grid.location(other)
+                        h = estimates[other] = octile(row - goal_row, col - goal_col)
+                    heapq.heappush(frontier, (round(new_g + h, 9), other))
+        return None
+
+    def refine(self, abstract, temporary):
+        grid = self.grid
+        path = [abstract[0]]
+        for a, b in zip(abstract, abstract[1:]):
+            if self.cluster(a) != self.cluster(b): # an entrance crossing, one step
+                path.append(b)
+            elif (a, b) in self.paths:
+                path.extend(self.unpack(a, self.paths[(a, b)])[1:])
+            elif (b, a) in self.paths:
+                path.extend(self.unpack(b, self.paths[(b, a)])[-2::-1])
+            elif (a, b) in temporary:
+                path.extend(temporary[(a, b)][1:])
+            else:
+                path.extend(temporary[(b, a)][-2::-1])
+        return [grid.location(cell) for cell in path]
+
+def load_hierarchical_grid_nav(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+############################################################
+# Section 3: Incremental Replanning (D* Lite)
+############################################################
+
+class IncrementalGridNav(object):
+
+    # D* Lite on a private copy of the scene: the search runs backwards from the goal and
+    # keeps its g/rhs values between calls, so after update_cells only the vertices whose
+    # distances actually changed are expanded again; move_start lets the start follow an
+    # agent along the path without starting over
+    def __init__(self, start, goal, scene):
+        grid = grid_map(scene)
+        self.grid = grid
+        self.cells = bytearray(grid.cells) # updates never touch the caller's scene
+        self.width = grid.width
+        self.start = grid.cell_id(start)
+        self.goal = grid.cell_id(goal)
+        self.km = 0.0
+        self.g = {}
+        self.rhs = {self.goal: 0.0}
+        self.queue = []
+        self.open_keys = {} # cell -> its current key; heap entries with another key are stale
+        self.push(self.goal)
+
+    def heuristic(self, a, b):
+        a_row, a_col = divmod(a, self.width)
+        b_row, b_col = divmod(b, self.width)
+        return octile(a_row - b_row, a_col - b_col)
+
+    def key(self, cell):
+        best = min(self.g.get(cell, math.inf), self.rhs.get(cell, math.inf))
+        return (round(best + self.heuristic(self.start, cell) + self.km, 9), best)
+
+    def push(self, cell):
+        key = self.key(cell)
+        self.open_keys[cell] = key
+        heapq.heappush(self.queue, (key, cell))
+
+    def top(self):
+        while self.queue and self.open_keys.get(self.queue[0][1]) != self.queue[0][0]:
+            heapq.heappop(self.queue)
+        if self.queue:
+            return self.queue[0]
+        return ((math.inf, math.inf), None)
+
+    def neighbors(self, cell):
+        # every grid neighbor with the cost of the edge; edges touching a blocked cell cost inf
+        cells = self.cells
+        blocked = cells[cell]
+        for offset, cost in self.grid.offsets:
+            other = cell + offset
+            if other < 0 or other >= len(cells):
+                continue
+            if blocked or cells[other]:
+                yield other, math.inf
+            else:
+                yield other, cost
+
+    def update_vertex(self, cell):
+        if cell != self.goal:
+            best = math.inf
+            for other, cost in self.neighbors(cell):
+                value = cost + self.g.get(other, math.inf)
+                if value < best:
+                    best = value
+            self.rhs[cell] = best
+        self.open_keys.pop(cell, None)
+        if self.g.get(cell, math.inf) != self.rhs.get(cell, math.inf):
+            self.push(cell)
+
+    def compute_shortest_path(self, stats=None):
+        while True:
+            key, cell = self.top()
+            start_key = self.key(self.start)
+            if cell is None or (key >= start_key and self.rhs.get(self.start, math.inf) == self.g.get(self.start, math.inf)):
+                return
+            heapq.heappop(self.queue)
+            del self.open_keys[cell]
+            new_key = self.key(cell)
+            if key < new_key:
+                self.push(cell)
+                continue
+            if stats is not None:
+                stats.nodes_expanded += 1
+                stats.frontier(len(self.open_keys) + 1)
+            g = self.g.get(cell, math.inf)
+            rhs = self.rhs.get(cell, math.inf)
+            if g > rhs:
+                self.g[cell] = rhs
+                for other, cost in self.neighbors(cell):
+                    if cost != math.inf:
+                        self.update_vertex(other)
+            else:
+                self.g[cell] = math.inf
+                self.update_vertex(cell)
+                for other, cost in self.neighbors(cell):
+                    self.update_vertex(other)
+
+    def find_path(self, stats=None):
+        # the current shortest path from start to goal as (row, col) cells, or None
+        with timed(stats):
+            if self.cells[self.start] or self.cells[self.goal]:
+                return None
+            self.compute_shortest_path(stats)
+            if self.g.get(self.start, math.inf) == math.inf:
+                return None
+            cell = self.start
+            path = [self.grid.location(cell)]
+            while cell != self.goal:
+                best, best_value = None, math.inf
+                for other, cost in self.neighbors(cell):
+                    value = cost + self.g.get(other, math.inf)
+                    if value < best_value:
+                        best, best_value = other, value
+                cell = best
+                path.append(self.grid.location(cell))
+            return path
+
+    def move_start(self, start):
+        new_start = self.grid.cell_id(start)
+        self.km += self.heuristic(self.start, new_start)
+        self.start = new_start
+
+    def update_cells(self, changes):
+        # changes maps (row, col) to True (now blocked) or False (now free), or is an
+        # iterable of such pairs
+        if hasattr(changes, "items"):
+            changes = changes.items()
+        touched = set()
+        for loc, blocked in changes:
+            if not self.grid.inside(loc):
+                continue
+            cell = self.grid.cell_id(loc)
+            if bool(self.cells[cell]) == bool(blocked):
+                continue
+            self.cells[cell] = 1 if blocked else 0
+            touched.add(cell)
+            for other, cost in self.neighbors(cell):
+                if not self.cells[other] or other in self.g or other in self.rhs:
+                    touched.add(other)
+        for cell in touched:
+            if self.grid.inside(self.grid.location(cell)):
+                self.update_vertex(cell)
+
+############################################################
+# Section 4: Scene Preprocessing (Components and ALT Landmarks)
+############################################################
+
+def grid_components(grid):
+    # labels every free cell with its connected component (moves as in GridNav), 0 for
+    # blocked cells; returns the labels and the size of each component by label
+    cells = grid.cells
+    offsets = [offset for offset, cost in grid.offsets]
+    labels = array("i", [0]) * grid.size
+    sizes = [0]
+    for row in range(grid.rows):
+        first = grid.cell_id((row, 0))
+        for seed in range(first, first + grid.cols):
+            if cells[seed] or labels[seed]:
+                continue
+            label = len(sizes)
+            labels[seed] = label
+            queue = collections.deque([seed])
+            count = 0
+            while queue:
+                cell = queue.popleft()
+                count += 1
+                for offset in offsets:
+                    other = cell + offset
+                    if not cells[other] and not labels[other]:
+                        labels[other] = label
+                        queue.append(other)
+            sizes.append(count)
+    return labels, sizes
+
+def grid_distances(grid, source):
+    # dijkstra from source over the whole GridMap; inf where unreachable
+    cells = grid.cells
+    offsets = grid.offsets
+    distances = array("d", [math.inf]) * grid.size
+    distances[source] = 0.0
+    frontier = [(0.0, source)]
+    while frontier:
+        d, cell = heapq.heappop(frontier)
+        if d > distances[cell]:
+            continue
+        for offset, cost in offsets:
+            other = cell + offset
+            if cells[other]:
+                continue
+            new_d = d + cost
+            if new_d < distances[other]:
+                distances[other] = new_d
+                heapq.heappush(frontier, (new_d, other))
+    return distances
+
+class SceneIndex(object):
+
+    # preprocessing for many queries on one fixed scene: component labels, so a query
+    # between components fails without searching, and dijkstra distance tables from a few
+    # landmarks for the ALT heuristic, max(octile, |d(l, goal) - d(l, cell)|), which is
+    # consistent and far tighter than octile around walls
+    # landmarks are picked by farthest-point selection; components smaller than
+    # min_component get none and fall back to octile
+    # an index pickles without its search scratch, and save / load_scene_index let worker
+    # processes share one copy on disk
+    def __init__(self, scene, landmarks=8, min_component=64):
+        self.grid = grid_map(scene)
+        self.labels, self.sizes = grid_components(self.grid)
+        self.landmarks = []
+        self.tables = []
+        self.choose_landmarks(landmarks, min_component)
+
+    def choose_landmarks(self, count, min_component):
+        grid = self.grid
+        labels = self.labels
+        sizes = self.sizes
+        # distance from each eligible cell to its nearest landmark so far, -1 if not eligible
+        nearest = array("d", [-1.0]) * grid.size
+        seed = None
+        for cell in range(grid.size):
+            if labels[cell] and sizes[labels[cell]] >= min_component:
+                nearest[cell] = math.inf
+                if seed is None or sizes[labels[cell]] > sizes[labels[seed]]:
+                    seed = cell
+        if seed is None:
+            return
+        # start from the cell farthest from an arbitrary one in the largest component
+        distances = grid_distances(grid, seed)
+        candidate = max(range(grid.size), key=lambda cell: distances[cell] if distances[cell] < math.inf else -1.0)
+        while len(self.landmarks) < count:
+            table = grid_distances(grid, candidate)
+            self.landmarks.append(candidate)
+            self.tables.append(table)
+            for cell in range(grid.size):
+                if table[cell] < nearest[cell]:
+                    nearest[cell] = table[cell]
+            # unserved components are infinitely far, so each big component gets a landmark
+            candidate = max(range(grid.size), key=nearest.__getitem__)
+            if nearest[candidate] <= 0:
+                break
+
+    def __getstate__(self):
+        return {
+            "rows": self.grid.rows,
+            "cols": self.grid.cols,
+            "cells": bytes(self.grid.cells),
+            "labels": self.labels,
+            "sizes": self.sizes,
+            "landmarks": self.landmarks,
+            "tables": self.tables,
+        }
+
+    def __setstate__(self, state):
+        self.grid = GridMap(state["rows"], state["cols"], bytearray(state["cells"]))
+        self.labels = state["labels"]
+        self.sizes = state["sizes"]
+        self.landmarks = state["landmarks"]
+        self.tables = state["tables"]
+
+    def save(self, path):
+        atomic_pickle(self, path)
+
+    def connected(self, start, goal):
+        grid = self.grid
+        if grid.is_blocked(start) or grid.is_blocked(goal):
+            return False
+        return self.labels[grid.cell_id(start)] == self.labels[grid.cell_id(goal)]
+
+    def heuristic(self, target):
+        # the ALT heuristic towards target as a function of a cell id
+        width = self.grid.width
+        goal_row, goal_col = divmod(target, width)
+        pairs = [(table, table[target]) for table in self.tables if table[target] < math.inf]
+
+        def estimate(cell):
+            row, col = divmod(cell, width)
+            best = octile(row - goal_row, col - goal_col)
+            for table, to_goal in pairs:
+                bound = table[cell] - to_goal
+                if bound < 0:
+                    bound = -bound
+                if bound > best:
+                    best = bound
+            return best
+        return estimate
+
+    def find_path(self, start, goal, stats=None):
+        # same paths and costs as find_path(..., method="grid"), None at once when start and
+        # goal are in different components
+        if not self.connected(start, goal):
+            return None
+        with timed(stats):
+            target = self.grid.cell_id(goal)
+            return grid_a_star(self.grid, tuple(start), tuple(goal), stats, self.heuristic(target))
+
+def load_scene_index(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+############################################################
+# Section 5: Map Files
+############################################################
+
+# MovingAI terrain: ".", "G" and "S" are passable, everything else ("@", "O", "T", "W")
+# is blocked
+MOVINGAI_BLOCKED = bytes(0 if chr(byte) in ".GS" else 1 for byte in range(256))
+
+def read_header(view, fields, end):
+    # "key value" lines up to and including the line that is just end; returns the values
+    # as a dict and the offset just after the end line
+    values = {}
+    pos = 0
+    while True:
+        stop = view.find(b"\n", pos)
+        if stop < 0:
+            raise ValueError("map header has no %r line" % (end,))
+        words = view[pos:stop].split()
+        pos = stop + 1
+        if words == [end]:
+            break
+        if len(words) == 2 and words[0] in fields:
+            values[words[0]] = words[1]
+    for field in fields:
+        if field not in values:
+            raise ValueError("map header has no %r" % (field,))
+    return values, pos
+
+def load_movingai_map(path):
+    # a GridMap from a MovingAI .map file; the file is memory-mapped and every row is
+    # translated in one call straight into the padded buffer, so no per-cell objects exist
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        header, pos = read_header(view, (b"height", b"width"), b"map")
+        rows, cols = int(header[b"height"]), int(header[b"width"])
+        width = cols + 1
+        cells = bytearray(b"\x01") * (width * (rows + 2) + 2) # the layout grid_map builds
+        for row in range(rows):
+            line = view[pos:pos + cols]
+            if len(line) < cols or b"\n" in line:
+                raise ValueError("map row %d is shorter than %d" % (row, cols))
+            start = width + 1 + row * width
+            cells[start:start + cols] = line.translate(MOVINGAI_BLOCKED)
+            pos = view.find(b"\n", pos + cols) + 1
+            if pos == 0 and row < rows - 1:
+                raise ValueError("map has fewer than %d rows" % rows)
+    return GridMap(rows, cols, cells)
+
+# bit-packed maps: a "BITMAP" header with "rows" and "cols" lines, a "data" line, then one
+# row after another, each (cols + 7) // 8 bytes, most significant bit first, 1 = blocked
+
+BIT_CELLS = bytes.maketrans(b"01", b"\x00\x01")
+
+def save_bitmap(grid, path):
+    grid = grid_map(grid)
+    row_bytes = (grid.cols + 7) // 8
+    pad_bits = 8 * row_bytes - grid.cols
+    with open(path, "wb") as f:
+        f.write(b"BITMAP\nrows %d\ncols %d\ndata\n" % (grid.rows, grid.cols))
+        for row in range(grid.rows):
+            start = grid.cell_id((row, 0))
+            bits = bytes(grid.cells[start:start + grid.cols]).translate(bytes.maketrans(b"\x00\x01", b"01"))
+            f.write((int(bits + b"0" * pad_bits, 2) if bits else 0).to_bytes(row_bytes, "big"))
+
+def load_bitmap(path):
+    # a GridMap from a bit-packed map; each row is unpacked in bulk through an int, so the
+    # cost is a few C-level operations per row
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        header, pos = read_header(view, (b"rows", b"cols"), b"data")
+        rows, cols = int(header[b"rows"]), int(header[b"cols"])
+        row_bytes = (cols + 7) // 8
+        if len(view) - pos < rows * row_bytes:
+            raise ValueError("bitmap has fewer than %d rows" % rows)
+        width = cols + 1
+        cells = bytearray(b"\x01") * (width * (rows + 2) + 2) # the layout grid_map builds
+        for row in range(rows):
+            packed = int.from_bytes(view[pos:pos + row_bytes], "big")
+            pos += row_bytes
+            start = width + 1 + row * width
+            bits = format(packed, "0%db" % (8 * row_bytes)).encode()
+            cells[start:start + cols] = bits[:cols].translate(BIT_CELLS)
+    return GridMap(rows, cols, cells)
+
+def load_map(path):
+    # picks the loader from the file's first line
+    with open(path, "rb") as f:
+        first = f.readline().strip()
+    if first == b"BITMAP":
+        return load_bitmap(path)
+    return load_movingai_map(path)
@@ -7,6 +7,14 @@ import random
 import copy
 from queue import PriorityQueue 
 import math
+import heapq
+import itertools
+import collections
+import mmap
+import os
+from search import Problem, anytime_a_star
+from search_stats import timed
+from uninformed_search import DiskProblem
 
 
 ############################################################
@@ -105,7 +113,12 @@ class TilePuzzle(object):
         if iter_right.perform_move('right'):
             yield 'right', iter_right
 
-    def find_solutions_iddfs(self):
+    def find_solutions_iddfs(self, fast=False, table_size=1 << 20):
+        # fast yields the same solutions, in the same order, from tile_all_optimal
+        if fast:
+            for moves in tile_all_optimal(self.flat(), self.r, self.c, table_size):
+                yield moves
+            return
         if self.is_solved():
             yield []
             return
@@ -123,6 +136,13 @@ class TilePuzzle(object):
             # but if none of them ar solved, just return
             depth += 1
 
+    def find_solution_ida_star(self, stats=None, heuristic=None):
+        # optimal moves in O(depth) memory; see tile_ida_star
+        if isinstance(heuristic, PatternDatabase):
+            heuristic.check(self.r, self.c)
+        with timed(stats):
+            return tile_ida_star(self.flat(), self.r, self.c, stats, heuristic)
+
     def iddfs_helper(self, depth_remaining, moves):
         if depth_remaining <= 0:
             yield moves, self
@@ -137,6 +157,12 @@ class TilePuzzle(object):
                 for moves_made, puzzles in puzzle.iddfs_helper(depth_remaining, new_moves):
                     yield moves_made, puzzles
 
+    def as_problem(self):
+        return TileProblem(self)
+
+    def flat(self):
+        return tuple(tile for row in self.board for tile in row)
+
     def heuristic_calc(self):
         heuristic_val = 0
         n1 = self.r
@@ -148,7 +174,26 @@ class TilePuzzle(object):
         return heuristic_val
 
     # Required
-    def find_solution_a_star(self):
+    def find_solution_a_star(self, stats=None, fast=False, heuristic=None):
+        # fast searches flat tuples with heapq and an incremental manhattan distance;
+        # heuristic, e.g. a PatternDatabase, replaces manhattan and implies fast
+        if isinstance(heuristic, PatternDatabase):
+            heuristic.check(self.r, self.c)
+        with timed(stats):
+            if fast or heuristic is not None:
+                return tile_a_star(self.flat(), self.r, self.c, stats, heuristic)
+            return self.a_star_helper(stats)
+
+    def find_solution_anytime(self, time_limit=None, node_limit=None, weight=3.0, stats=None):
+        # ARA* (search.anytime_a_star) with manhattan distance: a fast weighted solution
+        # first, improved until the optimum is proven or the budget of time_limit seconds or
+        # node_limit expansions runs out; returns (moves, bound), bound as in anytime_a_star
+        with timed(stats):
+            if not tile_solvable(self.flat(), self.r, self.c):
+                return None, math.inf
+            return anytime_a_star(self.as_problem(), weight, 0.5, time_limit, node_limit, stats)
+
+    def a_star_helper(self, stats=None):
 
         frontier = PriorityQueue()
         cost = 0
@@ -171,11 +216,18 @@ class TilePuzzle(object):
 
             # if the vertex has already been visited, ignore it and dequeue the next element
             if tup in visited:    
+                if stats is not None:
+                    stats.duplicates_pruned += 1
                 continue
             
             # if not visited previously, add the vertex to the set of visited elements
             else:
                 visited.add(tup)  
+
+            if stats is not None:
+                stats.nodes_expanded += 1
+                stats.frontier(frontier.qsize() + 1)
+                stats.visited_size = len(visited)
             
             # if the vertex's board is solved, the optimal solution has been found. Return the moves. 
             if vertex[3].is_solved(): 
@@ -184,11 +236,405 @@ class TilePuzzle(object):
 
             # if not solved, find all the children to the current vertex/board    
             for (move, puzzle) in vertex[3].successors():
+                if stats is not None:
+                    stats.nodes_generated += 1
 
                 # if the children have NOT been visited in the past, then queue them onto the frontier
                 if tuple(tuple(item) for item in puzzle.board) not in visited:
                     frontier.put((vertex[1] + 1 + puzzle.heuristic_calc(), vertex[1] + 1, vertex[2] + [move], puzzle))
 
+class TileProblem(Problem):
+
+    # flat tuple boards for the generic searches in search.py, with a manhattan heuristic
+    MOVES = (('up', -1, 0), ('down', 1, 0), ('left', 0, -1), ('right', 0, 1))
+
+    def __init__(self, puzzle):
+        self.r = puzzle.r
+        self.c = puzzle.c
+        self.start = tuple(tile for row in puzzle.get_board() for tile in row)
+        self.goal = tuple(range(1, self.r * self.c)) + (0,)
+
+    def initial(self):
+        return self.start
+
+    def is_goal(self, state):
+        return state == self.goal
+
+    def successors(self, state):
+        blank = state.index(0)
+        row, col = divmod(blank, self.c)
+        for move, dr, dc in TileProblem.MOVES:
+            if 0 <= row + dr < self.r and 0 <= col + dc < self.c:
+                other = blank + dr * self.c + dc
+                board = list(state)
+                board[blank], board[other] = board[other], 0
+                yield move, tuple(board), 1
+
+    def heuristic(self, state):
+        total = 0
+        for index, tile in enumerate(state):
+            if tile:
+                total += abs(index // self.c - (tile - 1) // self.c) + abs(index % self.c - (tile - 1) % self.c)
+        return total
+
+def tile_neighbors(rows, cols):
+    # neighbors[blank] lists (move, cell) for every cell the blank can swap with, in the
+    # order of TilePuzzle.successors
+    neighbors = []
+    for blank in range(rows * cols):
+        row, col = divmod(blank, cols)
+        options = []
+        for move, dr, dc in TileProblem.MOVES:
+            if 0 <= row + dr < rows and 0 <= col + dc < cols:
+                options.append((move, blank + dr * cols + dc))
+        neighbors.append(options)
+    return neighbors
+
+def tile_distances(rows, cols):
+    # distances[tile][cell] is the manhattan distance from cell to the tile's goal cell
+    distances = [[0] * (rows * cols)]
+    for tile in range(1, rows * cols):
+        goal_row, goal_col = divmod(tile - 1, cols)
+        distances.append([abs(cell // cols - goal_row) + abs(cell % cols - goal_col) for cell in range(rows * cols)])
+    return distances
+
+def tile_a_star(start, rows, cols, stats=None, heuristic=None):
+    # A* over flat tuples; a move shifts one tile, so h is updated by that tile's delta
+    # instead of rescanning the board, and paths come back through parent pointers
+    # heuristic(board), if given, is used instead of manhattan
+    neighbors = tile_neighbors(rows, cols)
+    distances = tile_distances(rows, cols)
+    goal = tuple(range(1, rows * cols)) + (0,)
+    if heuristic is None:
+        h = sum(distances[tile][cell] for cell, tile in enumerate(start))
+    else:
+        h = heuristic(start)
+    counter = itertools.count()
+    # (f, h, tie, g, state, blank): equal f goes to the lower h, i.e. the deeper node
+    frontier = [(h, h, next(counter), 0, start, start.index(0))]
+    parents = {start: None}
+    best_g = {start: 0}
+    closed = set()
+    while frontier:
+        f, h, tie, g, state, blank = heapq.heappop(frontier)
+        if state in closed:
+            if stats is not None:
+                stats.duplicates_pruned += 1
+            continue
+        if state == goal:
+            moves = []
+            while parents[state] is not None:
+                state, move = parents[state]
+                moves.append(move)
+            moves.reverse()
+            return moves
+        closed.add(state)
+        if stats is not None:
+            stats.nodes_expanded += 1
+            stats.frontier(len(frontier) + 1)
+            stats.visited_size = len(closed)
+        g += 1
+        for move, cell in neighbors[blank]:
+            tile = state[cell]
+            board = list(state)
+            board[blank] = tile
+            board[cell] = 0
+            child = tuple(board)
+            if stats is not None:
+                stats.nodes_generated += 1
+            if child in closed or g >= best_g.get(child, g + 1):
+                if stats is not None:
+                    stats.duplicates_pruned += 1
+                continue
+            best_g[child] = g
+            parents[child] = (state, move)
+            if heuristic is None:
+                child_h = h - distances[tile][cell] + distances[tile][blank]
+            else:
+                child_h = heuristic(child)
+            heapq.heappush(frontier, (g + child_h, child_h, next(counter), g, child, cell))
+    return None
+
+def tile_solvable(start, rows, cols):
+    # inversion parity; with an even width the blank's row counts too
+    tiles = [tile for tile in start if tile]
+    inversions = 0
+    for i in range(len(tiles)):
+        for j in range(i + 1, len(tiles)):
+            if tiles[i] > tiles[j]:
+                inversions += 1
+    if cols % 2 == 1:
+        return inversions % 2 == 0
+    return (inversions + start.index(0) // cols) % 2 == (rows - 1) % 2
+
+def tile_all_optimal(start, rows, cols, table_size=1 << 20):
+    # every shortest solution, in the order of TilePuzzle.find_solutions_iddfs, as a stream
+    # depth first under a bound that grows by two (every move changes manhattan by one),
+    # pruning on g + manhattan > bound; the board is changed in place and a goal is h == 0
+    # the table (at most table_size states, reset every iteration) holds the smallest g a
+    # state was reached at and whether its subtree failed there: a later visit at a larger g
+    # cannot be on a shortest path, and one at an equal g after a failure cannot succeed
+    if not tile_solvable(start, rows, cols):
+        return
+    neighbors = tile_neighbors(rows, cols)
+    distances = tile_distances(rows, cols)
+    board = list(start)
+    h = sum(distances[tile][cell] for cell, tile in enumerate(board))
+    path = []
+
+    def search(g, h, bound, blank, table):
+        if h == 0:
+            yield list(path)
+            return
+        if g + h > bound:
+            return
+        key = bytes(board)
+        seen = table.get(key)
+        if seen is not None and (g > seen >> 1 or (g == seen >> 1 and seen & 1)):
+            return
+        if seen is not None or len(table) < table_size:
+            table[key] = g << 1
+        found = False
+        for move, cell in neighbors[blank]:
+            tile = board[cell]
+            board[blank] = tile
+            board[cell] = 0
+            path.append(move)
+            for moves in search(g + 1, h + distances[tile][blank] - distances[tile][cell], bound, cell, table):
+                found = True
+                yield moves
+            path.pop()
+            board[cell] = tile
+            board[blank] = 0
+        if not found and key in table and table[key] >> 1 == g:
+            table[key] = (g << 1) | 1
+
+    bound = h
+    blank = board.index(0)
+    while True:
+        found = False
+        for moves in search(0, h, bound, blank, {}):
+            found = True
+            yield moves
+        if found:
+            return
+        bound += 2
+
+def tile_line_conflict(goals):
+    # goals are the goal positions, along the line, of the tiles that belong to it, in the
+    # order they sit now; each tile that has to leave the line to let the others pass costs
+    # two extra moves, and the fewest such tiles is len - longest increasing run
+    if len(goals) < 2:
+        return 0
+    longest = [1] * len(goals)
+    for i in range(len(goals)):
+        for j in range(i):
+            if goals[j] < goals[i] and longest[j] + 1 > longest[i]:
+                longest[i] = longest[j] + 1
+    return 2 * (len(goals) - max(longest))
+
+def tile_ida_star(start, rows, cols, stats=None, heuristic=None):
+    # IDA* with manhattan + linear conflict; the board is one list changed in place by
+    # make/unmake, the move that undoes the previous one is never tried, and only the
+    # conflicts of the moved tile's own line are recomputed
+    # heuristic(board), if given, is combined with that bound by taking the larger
+    if not tile_solvable(start, rows, cols):
+        return None
+    neighbors = tile_neighbors(rows, cols)
+    distances = tile_distances(rows, cols)
+    goal_row = [0] + [(tile - 1) // cols for tile in range(1, rows * cols)]
+    goal_col = [0] + [(tile - 1) % cols for tile in range(1, rows * cols)]
+    board = list(start)
+
+    def row_conflict(row):
+        return tile_line_conflict([goal_col[t] for t in board[row * cols:(row + 1) * cols] if t and goal_row[t] == row])
+
+    def col_conflict(col):
+        return tile_line_conflict([goal_row[t] for t in board[col::cols] if t and goal_col[t] == col])
+
+    row_lc = [row_conflict(row) for row in range(rows)]
+    col_lc = [col_conflict(col) for col in range(cols)]
+    h = sum(distances[tile][cell] for cell, tile in enumerate(board)) + sum(row_lc) + sum(col_lc)
+    next_bound = math.inf
+    path = []
+
+    def search(g, h, bound, blank, previous):
+        nonlocal next_bound
+        f = g + h
+        if heuristic is not None and f <= bound:
+            f = max(f, g + heuristic(board))
+        if f > bound:
+            if f < next_bound:
+                next_bound = f
+            return False
+        if h == 0:
+            return True
+        if stats is not None:
+            stats.nodes_expanded += 1
+            stats.frontier(g + 1)
+        for move, cell in neighbors[blank]:
+            if cell == previous: # undoing the last move
+                continue
+            if stats is not None:
+                stats.nodes_generated += 1
+            tile = board[cell]
+            board[blank] = tile
+            board[cell] = 0
+            child_h = h + distances[tile][blank] - distances[tile][cell]
+            # only lines the tile belongs to can change their conflicts
+            if blank // cols == cell // cols: # horizontal: the tile changes column
+                table, old_line, new_line, conflict = col_lc, cell % cols, blank % cols, col_conflict
+                home = goal_col[tile]
+            else: # vertical: the tile changes row
+                table, old_line, new_line, conflict = row_lc, cell // cols, blank // cols, row_conflict
+                home = goal_row[tile]
+            if home == old_line or home == new_line:
+                saved = table[home]
+                table[home] = conflict(home)
+                child_h += table[home] - saved
+            path.append(move)
+            if search(g + 1, child_h, bound, cell, blank):
+                return True
+            path.pop()
+            if home == old_line or home == new_line:
+                table[home] = saved
+            board[cell] = tile
+            board[blank] = 0
+        return False
+
+    bound = h
+    blank = board.index(0)
+    while True:
+        next_bound = math.inf
+        if search(0, h, bound, blank, -1):
+            return path
+        bound = next_bound
+
+def build_pattern_database(rows, cols, pattern, path):
+    # backward 0-1 bfs over the positions of the pattern tiles plus the blank, from the goal;
+    # only moves of pattern tiles cost 1, so databases over disjoint patterns add up
+    # the table stores, for each placement of the pattern tiles, the fewest pattern moves to
+    # the goal (over all blank cells), one byte per entry, indexed by sum(pos_i * n ** i)
+    # memory while building is n ** (len(pattern) + 1) bytes (268 MB for 6 tiles on 4x4)
+    n = rows * cols
+    k = len(pattern)
+    powers = [n ** i for i in range(k + 1)]
+    neighbors = tile_neighbors(rows, cols)
+    goal = [tile - 1 for tile in pattern] + [n - 1] # the blank is the last digit
+    table = bytearray(b"\xff") * powers[k]
+    dist = bytearray(b"\xff") * (powers[k] * n)
+    start = sum(cell * powers[i] for i, cell in enumerate(goal))
+    dist[start] = 0
+    queue = collections.deque([start])
+    while queue:
+        index = queue.popleft()
+        d = dist[index]
+        if table[index % powers[k]] == 255: # pops come in order of distance
+            table[index % powers[k]] = d
+        cells = []
+        rest = index
+        for i in range(k + 1):
+            rest, cell = divmod(rest, n)
+            cells.append(cell)
+        blank = cells[k]
+        for move, cell in neighbors[blank]:
+            if cell in cells:
+                i = cells.index(cell)
+                child = index + (blank - cell) * powers[i] + (cell - blank) * powers[k]
+                if d + 1 < dist[child]:
+                    dist[child] = d + 1
+                    queue.append(child)
+            else:
+                child = index + (cell - blank) * powers[k]
+                if d < dist[child]:
+                    dist[child] = d
+                    queue.appendleft(child)
+    del dist
+    header = ("PDB %d %d %s\n" % (rows, cols, ",".join(str(tile) for tile in pattern))).encode()
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(table)
+    os.replace(tmp, path)
+    return path
+
+class PatternDatabase(object):
+
+    # additive disjoint pattern databases, each file memory-mapped read-only so every
+    # process that loads it shares one copy through the page cache
+    def __init__(self, paths):
+        self.tables = []
+        try:
+            for path in paths:
+                self.load(path)
+        except BaseException:
+            self.close()
+            raise
+
+    def load(self, path):
+        # the header and the file size are checked before the table is mapped; the mapping
+        # keeps its own handle, so the file is closed either way
+        with open(path, "rb") as f:
+            header = f.readline(4096).split()
+            try:
+                if len(header) != 4 or header[0] != b"PDB":
+                    raise ValueError
+                rows, cols = int(header[1]), int(header[2])
+                pattern = [int(tile) for tile in header[3].split(b",")]
+            except ValueError:
+                raise ValueError("not a pattern database: %s" % path) from None
+            if self.tables and (rows, cols) != (self.rows, self.cols):
+                raise ValueError("pattern databases for different board sizes")
+            n = rows * cols
+            offset = f.tell()
+            if os.fstat(f.fileno()).st_size != offset + n ** len(pattern):
+                raise ValueError("truncated pattern database: %s" % path)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.rows, self.cols = rows, cols
+        self.tables.append((pattern, [n ** i for i in range(len(pattern))], offset, data))
+
+    def check(self, rows, cols):
+        if (rows, cols) != (self.rows, self.cols):
+            raise ValueError("pattern database is for %dx%d boards, not %dx%d" % (self.rows, self.cols, rows, cols))
+
+    def __call__(self, board):
+        # board is a flat sequence of tiles, 0 for the blank
+        where = [0] * (self.rows * self.cols)
+        for cell, tile in enumerate(board):
+            where[tile] = cell
+        total = 0
+        for pattern, powers, offset, data in self.tables:
+            index = offset
+            for i in range(len(pattern)):
+                index += where[pattern[i]] * powers[i]
+            total += data[index]
+        return total
+
+    def close(self):
+        for pattern, powers, offset, data in self.tables:
+            data.close()
+        self.tables = []
+
+def default_patterns(rows, cols):
+    # 4-4 for 3x3, 5-5-5 for 4x4, otherwise consecutive runs of at most five tiles
+    if (rows, cols) == (3, 3):
+        return [(1, 2, 3, 4), (5, 6, 7, 8)]
+    if (rows, cols) == (4, 4):
+        return [(1, 2, 3, 5, 6), (4, 7, 8, 11, 12), (9, 10, 13, 14, 15)]
+    tiles = list(range(1, rows * cols))
+    return [tuple(tiles[i:i + 5]) for i in range(0, len(tiles), 5)]
+
+def build_pattern_databases(rows, cols, directory, patterns=None):
+    # e.g. patterns=[(1, 2, 3, 4, 5, 6), (7, 8, 9, 10, 11, 12), (13, 14, 15)] for 6-6-3 on 4x4
+    if patterns is None:
+        patterns = default_patterns(rows, cols)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for pattern in patterns:
+        name = "tile_%dx%d_%s.pdb" % (rows, cols, "-".join(str(tile) for tile in pattern))
+        paths.append(build_pattern_database(rows, cols, pattern, os.path.join(directory, name)))
+    return paths
+
 ############################################################
 # Section 2: Grid Navigation
 ############################################################
@@ -293,12 +739,433 @@ class GridNav(object):
         if iter_downright.perform_move('down-right'):
             yield 'down-right', iter_downright.loc, iter_downright
 
+    def as_problem(self):
+        return GridNavProblem(self.loc, self.goal, self.scene)
+
     def heuristic_calc(self):
         a = math.pow((self.loc[0] - self.goal[0]), 2)
         b = math.pow((self.loc[1] - self.goal[1]), 2)
         return (a+b)**0.5
 
-def find_path(start, goal, scene):
+class GridNavProblem(Problem):
+
+    # (row, col) locations for the generic searches in search.py; moves are named by the
+    # location they reach, so path_to gives the same path as find_path minus the start
+    MOVES = ((-1, 0, 1), (1, 0, 1), (0, -1, 1), (0, 1, 1),
+             (-1, -1, 2 ** 0.5), (-1, 1, 2 ** 0.5), (1, -1, 2 ** 0.5), (1, 1, 2 ** 0.5))
+
+    def __init__(self, start, goal, scene):
+        self.start = tuple(start)
+        self.goal = tuple(goal)
+        self.scene = scene
+        self.r = len(scene)
+        self.c = len(scene[0])
+
+    def initial(self):
+        return self.start
+
+    def is_goal(self, state):
+        return state == self.goal
+
+    def successors(self, state):
+        row, col = state
+        for dr, dc, cost in GridNavProblem.MOVES:
+            if 0 <= row + dr < self.r and 0 <= col + dc < self.c and not self.scene[row + dr][col + dc]:
+                yield (row + dr, col + dc), (row + dr, col + dc), cost
+
+    def heuristic(self, state):
+        return ((state[0] - self.goal[0]) ** 2 + (state[1] - self.goal[1]) ** 2) ** 0.5
+
+SQRT2 = 2 ** 0.5
+
+class GridMap(object):
+
+    # occupancy of a scene as one flat buffer of bytes, nonzero for blocked cells, with a
+    # blocked border so neighbors need no bounds checks: rows are cols + 1 wide (the extra
+    # byte separates a row from the next) and a further width + 1 bytes pad each end
+    # cell (r, c) is id pad + r * width + c
+    def __init__(self, rows, cols, cells):
+        self.rows = rows
+        self.cols = cols
+        self.width = cols + 1
+        self.pad = self.width + 1
+        self.cells = cells
+        w = self.width
+        # in the order of GridNav.successors
+        self.offsets = ((-w, 1), (w, 1), (-1, 1), (1, 1),
+                        (-w - 1, SQRT2), (-w + 1, SQRT2), (w - 1, SQRT2), (w + 1, SQRT2))
+        self.size = len(cells)
+
+    def cell_id(self, loc):
+        return self.pad + loc[0] * self.width + loc[1]
+
+    def location(self, cell):
+        return divmod(cell - self.pad, self.width)
+
+    def inside(self, loc):
+        return 0 <= loc[0] < self.rows and 0 <= loc[1] < self.cols
+
+    def is_blocked(self, loc):
+        return not self.inside(loc) or self.cells[self.cell_id(loc)] != 0
+
+def grid_map(scene):
+    # a GridMap from a list of lists of bools (True for blocked); GridMaps pass through
+    if isinstance(scene, GridMap):
+        return scene
+    rows = len(scene)
+    cols = len(scene[0])
+    width = cols + 1
+    cells = bytearray(b"\x01") * (width + 1)
+    for row in scene:
+        cells += bytes(row)
+        cells.append(1)
+    cells += b"\x01" * (width + 1)
+    return GridMap(rows, cols, cells)
+
+def octile(dr, dc):
+    if dr < 0:
+        dr = -dr
+    if dc < 0:
+        dc = -dc
+    if dr < dc:
+        return dc + (SQRT2 - 1) * dr
+    return dr + (SQRT2 - 1) * dc
+
+def grid_path(grid, parent, cell, start):
+    path = [grid.location(cell)]
+    while cell != start:
+        cell = parent[cell]
+        path.append(grid.location(cell))
+    path.reverse()
+    return path
+
+def grid_a_star(grid, start, goal, stats=None, heuristic=None, closed=None):
+    # A* on a GridMap with integer cell ids, precomputed neighbor offsets, the octile
+    # heuristic and a heapq of (f, h, cell); no per-node objects are created, and g values
+    # and parents are dicts, so memory follows the cells reached rather than the map
+    # heuristic, if given, maps a cell id to a consistent estimate used instead of octile;
+    # closed, if given, is the set the expanded cells are added to
+    if grid.is_blocked(start) or grid.is_blocked(goal):
+        return None
+    cells = grid.cells
+    width = grid.width
+    offsets = grid.offsets
+    source = grid.cell_id(start)
+    target = grid.cell_id(goal)
+    goal_row, goal_col = divmod(target, width)
+    g = {source: 0.0}
+    parent = {}
+    if closed is None:
+        closed = set()
+    if heuristic is None:
+        row, col = divmod(source, width)
+        h = octile(row - goal_row, col - goal_col)
+    else:
+        h = heuristic(source)
+    frontier = [(h, h, source)]
+    while frontier:
+        f, h, cell = heapq.heappop(frontier)
+        if cell in closed:
+            if stats is not None:
+                stats.duplicates_pruned += 1
+            continue
+        if cell == target:
+            return grid_path(grid, parent, cell, source)
+        closed.add(cell)
+        base = g[cell]
+        if stats is not None:
+            stats.nodes_expanded += 1
+            stats.frontier(len(frontier) + 1)
+        for offset, cost in offsets:
+            child = cell + offset
+            if cells[child]:
+                continue
+            if stats is not None:
+                stats.nodes_generated += 1
+            new_g = base + cost
+            if child in closed or new_g >= g.get(child, math.inf):
+                continue
+            g[child] = new_g
+            parent[child] = cell
+            if heuristic is None:
+                row, col = divmod(child, width)
+                h = octile(row - goal_row, col - goal_col)
+            else:
+                h = heuristic(child)
+            heapq.heappush(frontier, (round(new_g + h, 9), h, child))
+    return None
+
+def sign(x):
+    return (x > 0) - (x < 0)
+
+def jps_jump(cells, width, cell, dr, dc, target):
+    # walk from cell in direction (dr, dc) until a jump point: the target, a cell with a
+    # forced neighbor, or (diagonally) a cell from which a straight jump finds one
+    # diagonal moves may pass between two blocked cells, as in GridNav
+    step = dr * width + dc
+    up = dr * width
+    steps = 0
+    while True:
+        cell += step
+        if cells[cell]:
+            return None, 0
+        steps += 1
+        if cell == target:
+            return cell, steps
+        if dr and dc:
+            if (not cells[cell - dc + up] and cells[cell - dc]) or (not cells[cell + dc - up] and cells[cell - up]):
+                return cell, steps
+            if jps_jump(cells, width, cell, dr, 0, target)[0] is not None or jps_jump(cells, width, cell, 0, dc, target)[0] is not None:
+                return cell, steps
+        elif dc:
+            if (not cells[cell + dc + width] and cells[cell + width]) or (not cells[cell + dc - width] and cells[cell - width]):
+                return cell, steps
+        else:
+            if (not cells[cell + 1 + up] and cells[cell + 1]) or (not cells[cell - 1 + up] and cells[cell - 1]):
+                return cell, steps
+
+def jps_directions(cells, width, cell, dr, dc):
+    # directions worth jumping in after arriving at cell moving (dr, dc); the rest are
+    # reached at least as cheaply through the parent
+    if dr and dc:
+        directions = [(dr, 0), (0, dc), (dr, dc)]
+        if cells[cell - dc]:
+            directions.append((dr, -dc))
+        if cells[cell - dr * width]:
+            directions.append((-dr, dc))
+    elif dc:
+        directions = [(0, dc)]
+        if cells[cell + width]:
+            directions.append((1, dc))
+        if cells[cell - width]:
+            directions.append((-1, dc))
+    else:
+        directions = [(dr, 0)]
+        if cells[cell + 1]:
+            directions.append((dr, 1))
+        if cells[cell - 1]:
+            directions.append((dr, -1))
+    return directions
+
+ALL_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+
+def grid_jps(grid, start, goal, stats=None):
+    # jump point search: A* over jump points only, with the same costs and paths of the same
+    # cost as grid_a_star; the returned path lists every cell, like find_path
+    if grid.is_blocked(start) or grid.is_blocked(goal):
+        return None
+    cells = grid.cells
+    width = grid.width
+    source = grid.cell_id(start)
+    target = grid.cell_id(goal)
+    goal_row, goal_col = divmod(target, width)
+    g = {source: 0.0}
+    parent = {source: source}
+    closed = set()
+    row, col = divmod(source, width)
+    h = octile(row - goal_row, col - goal_col)
+    frontier = [(h, h, source)]
+    while frontier:
+        f, h, cell = heapq.heappop(frontier)
+        if cell in closed:
+            if stats is not None:
+                stats.duplicates_pruned += 1
+            continue
+        if cell == target:
+            points = grid_path(grid, parent, cell, source)
+            path = [points[0]]
+            for (r1, c1), (r2, c2) in zip(points, points[1:]):
+                dr, dc = sign(r2 - r1), sign(c2 - c1)
+                for k in range(1, max(abs(r2 - r1), abs(c2 - c1)) + 1):
+                    path.append((r1 + k * dr, c1 + k * dc))
+            return path
+        closed.add(cell)
+        base = g[cell]
+        if stats is not None:
+            stats.nodes_expanded += 1
+            stats.frontier(len(frontier) + 1)
+        row, col = divmod(cell, width)
+        if cell == source:
+            directions = ALL_DIRECTIONS
+        else:
+            parent_row, parent_col = divmod(parent[cell], width)
+            directions = jps_directions(cells, width, cell, sign(row - parent_row), sign(col - parent_col))
+        for dr, dc in directions:
+            child, steps = jps_jump(cells, width, cell, dr, dc, target)
+            if child is None:
+                continue
+            if stats is not None:
+                stats.nodes_generated += 1
+            new_g = base + steps * (SQRT2 if dr and dc else 1)
+            if child in closed or new_g >= g.get(child, math.inf):
+                continue
+            g[child] = new_g
+            parent[child] = cell
+            child_row, child_col = divmod(child, width)
+            h = octile(child_row - goal_row, child_col - goal_col)
+            heapq.heappush(frontier, (round(new_g + h, 9), h, child))
+    return None
+
+class GridMapProblem(Problem):
+
+    # cell ids of a GridMap for the generic searches in search.py, with the octile
+    # heuristic; moves are named by the location they reach, as in GridNavProblem
+    def __init__(self, grid, start, goal):
+        self.grid = grid
+        self.start = grid.cell_id(start)
+        self.goal = grid.cell_id(goal)
+        self.goal_row, self.goal_col = divmod(self.goal, grid.width)
+
+    def initial(self):
+        return self.start
+
+    def is_goal(self, state):
+        return state == self.goal
+
+    def successors(self, state):
+        cells = self.grid.cells
+        for offset, cost in self.grid.offsets:
+            child = state + offset
+            if not cells[child]:
+                yield self.grid.location(child), child, cost
+
+    def heuristic(self, state):
+        row, col = divmod(state, self.grid.width)
+        return octile(row - self.goal_row, col - self.goal_col)
+
+def find_path_anytime(start, goal, scene, time_limit=None, node_limit=None, weight=3.0, stats=None):
+    # ARA* on the grid engine: returns (path, bound), the best path found within time_limit
+    # seconds or node_limit expansions and a factor its cost is within of the shortest
+    grid = grid_map(scene)
+    start, goal = tuple(start), tuple(goal)
+    if grid.is_blocked(start) or grid.is_blocked(goal):
+        return None, math.inf
+    with timed(stats):
+        moves, bound = anytime_a_star(GridMapProblem(grid, start, goal), weight, 0.5, time_limit, node_limit, stats)
+        if moves is None:
+            return None, bound
+        return [start] + moves, bound
+
+def scene_window(scene, start, goal, margin):
+    # a GridMap of the part of scene within margin of the box around start and goal, with
+    # its first and last row and col in the scene
+    rows, cols = len(scene), len(scene[0])
+    (start_row, start_col), (goal_row, goal_col) = start, goal
+    first_row, last_row = max(0, min(start_row, goal_row) - margin), min(rows - 1, max(start_row, goal_row) + margin)
+    first_col, last_col = max(0, min(start_col, goal_col) - margin), min(cols - 1, max(start_col, goal_col) + margin)
+    window = grid_map([row[first_col:last_col + 1] for row in scene[first_row:last_row + 1]])
+    return window, (first_row, last_row, first_col, last_col)
+
+def scene_endpoints_free(start, goal, scene):
+    rows, cols = len(scene), len(scene[0])
+    for row, col in (start, goal):
+        if not (0 <= row < rows and 0 <= col < cols) or scene[row][col]:
+            return False
+    return True
+
+def window_a_star(start, goal, scene, stats=None):
+    # grid_a_star for a list-of-lists scene without converting all of it: the search runs
+    # in a window around start and goal, and the window doubles while the search expanded a
+    # cell on its edge with a free cell just outside; otherwise no path leaving the window
+    # can be cheaper (the heuristic is consistent), so the path found, or None, is final
+    if not scene_endpoints_free(start, goal, scene):
+        return None
+    margin = max(16, max(abs(start[0] - goal[0]), abs(start[1] - goal[1])) // 2)
+    while True:
+        window, (first_row, last_row, first_col, last_col) = scene_window(scene, start, goal, margin)
+        closed = set()
+        path = grid_a_star(window, (start[0] - first_row, start[1] - first_col),
+                           (goal[0] - first_row, goal[1] - first_col), stats, closed=closed)
+        if not window_leaked(window, closed, scene, first_row, first_col):
+            if path is None:
+                return None
+            return [(row + first_row, col + first_col) for row, col in path]
+        margin *= 2
+
+def window_jps(start, goal, scene, stats=None):
+    # grid_jps on a window of a list-of-lists scene, as window_a_star; jump point search
+    # expands too few cells for window_leaked, so the window doubles until no free cell
+    # just outside it is on a route (by octile distance) cheaper than the path found, and
+    # when the window has no path window_a_star settles whether the scene has one
+    if not scene_endpoints_free(start, goal, scene):
+        return None
+    margin = max(16, max(abs(start[0] - goal[0]), abs(start[1] - goal[1])) // 2)
+    while True:
+        window, bounds = scene_window(scene, start, goal, margin)
+        first_row, last_row, first_col, last_col = bounds
+        path = grid_jps(window, (start[0] - first_row, start[1] - first_col),
+                        (goal[0] - first_row, goal[1] - first_col), stats)
+        if path is None:
+            return window_a_star(start, goal, scene, stats)
+        cost = sum(SQRT2 if r1 != r2 and c1 != c2 else 1 for (r1, c1), (r2, c2) in zip(path, path[1:]))
+        if window_outside_bound(scene, bounds, start, goal) >= cost - 1e-9:
+            return [(row + first_row, col + first_col) for row, col in path]
+        margin *= 2
+
+def window_outside_bound(scene, bounds, start, goal):
+    # the least octile length of a route from start to goal through a free scene cell just
+    # outside the window with these bounds
+    rows, cols = len(scene), len(scene[0])
+    first_row, last_row, first_col, last_col = bounds
+    ring = []
+    for row in (first_row - 1, last_row + 1):
+        if 0 <= row < rows:
+            ring.extend((row, col) for col in range(max(0, first_col - 1), min(cols, last_col + 2)))
+    for col in (first_col - 1, last_col + 1):
+        if 0 <= col < cols:
+            ring.extend((row, col) for row in range(first_row, last_row + 1))
+    best = math.inf
+    for row, col in ring:
+        if not scene[row][col]:
+            best = min(best, octile(row - start[0], col - start[1]) + octile(row - goal[0], col - goal[1]))
+    return best
+
+def window_leaked(window, closed, scene, first_row, first_col):
+    # whether a search on window that expanded the cells in closed reached an edge cell
+    # next to a free scene cell outside the window
+    rows, cols = len(scene), len(scene[0])
+    edge = set()
+    if first_row > 0:
+        edge.update((0, col) for col in range(window.cols))
+    if first_row + window.rows < rows:
+        edge.update((window.rows - 1, col) for col in range(window.cols))
+    if first_col > 0:
+        edge.update((row, 0) for row in range(window.rows))
+    if first_col + window.cols < cols:
+        edge.update((row, window.cols - 1) for row in range(window.rows))
+    for row, col in edge:
+        if window.cell_id((row, col)) not in closed:
+            continue
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                if not window.inside((row + dr, col + dc)):
+                    r, c = row + dr + first_row, col + dc + first_col
+                    if 0 <= r < rows and 0 <= c < cols and not scene[r][c]:
+                        return True
+    return False
+
+def find_path(start, goal, scene, stats=None, method="grid"):
+    # method "grid" uses the array-backed engine; on a list-of-lists scene it only converts
+    # a window around the query (window_a_star), and a GridMap scene (build one with
+    # grid_map to reuse it) is searched directly; "jps" runs jump point search on the same
+    # engine, windowed in the same way (window_jps), and "astar" is the original GridNav
+    # search, for list-of-lists scenes only
+    if method not in ("astar", "grid", "jps"):
+        raise ValueError("unknown method: %r" % (method,))
+    if method == "astar" and isinstance(scene, GridMap):
+        raise ValueError("method 'astar' needs a list-of-lists scene")
+    with timed(stats):
+        if isinstance(scene, GridMap):
+            if method == "jps":
+                return grid_jps(scene, tuple(start), tuple(goal), stats)
+            return grid_a_star(scene, tuple(start), tuple(goal), stats)
+        if method == "jps":
+            return window_jps(tuple(start), tuple(goal), scene, stats)
+        if method == "grid":
+            return window_a_star(tuple(start), tuple(goal), scene, stats)
+        return find_path_helper(start, goal, scene, stats)
+
+def find_path_helper(start, goal, scene, stats=None):
 
     grid = GridNav(start, goal, scene)
     
@@ -326,10 +1193,19 @@ def find_path(start, goal, scene):
         if vertex[3].loc not in visited:    
             visited.add(vertex[3].loc)
         else:
+            if stats is not None:
+                stats.duplicates_pruned += 1
             continue
 
+        if stats is not None:
+            stats.nodes_expanded += 1
+            stats.frontier(frontier.qsize() + 1)
+            stats.visited_size = len(visited)
+
         # iterate through the children of the vertex 
         for (direction, location, puzzle) in vertex[3].successors():
+            if stats is not None:
+                stats.nodes_generated += 1
 
             # check them further only if not visited prior
             if location in visited: 
@@ -413,6 +1289,10 @@ class Disk(object):
                 return False
         return True
 
+    def as_problem(self):
+        goal = [0] * (self.length - self.n) + sorted(d for d in self.disks if d > 0)
+        return DiskProblem(self.disks, goal)
+
     def heuristic_calc(self):
         heuristic = 0
         for num in range(self.length):
@@ -420,7 +1300,16 @@ class Disk(object):
                 heuristic += abs(self.length - self.disks[num] - num - 1)
         return heuristic
 
-    def find_solution_a_star(self):
+    def find_solution_a_star(self, bidirectional=False, stats=None, max_states=2000000):
+        # bidirectional runs disk_bidirectional_a_star towards the sorted row, with optimal
+        # moves, or None once it holds max_states states
+        if bidirectional:
+            with timed(stats):
+                goal = [0] * (self.length - self.n) + sorted(d for d in self.disks if d > 0)
+                return disk_bidirectional_a_star(self.disks, goal, stats, max_states)
+        return self.a_star_helper()
+
+    def a_star_helper(self):
 
         frontier = PriorityQueue()
 
@@ -451,7 +1340,170 @@ class Disk(object):
 
         return None
 
-def solve_distinct_disks(length, n):
+def disk_estimate(cells, target):
+    # (moves each disk needs alone, ceil(distance to its target cell / 2) summed over the
+    # disks, disk pairs whose order differs from the target's); a move shifts one disk at
+    # most two cells and only a jump reorders a pair, one pair per jump, so the larger of
+    # the two is a lower bound, and a move changes either part by at most one
+    steps = 0
+    disks = []
+    for cell, d in enumerate(cells):
+        if d > 0:
+            steps += (abs(cell - target[d]) + 1) // 2
+            disks.append(target[d])
+    pairs = 0
+    for i in range(len(disks)):
+        for j in range(i + 1, len(disks)):
+            if disks[i] > disks[j]:
+                pairs += 1
+    return steps, pairs
+
+def disk_occupancy_distances(length, cells, limit=1000000):
+    # exact moves for identical disks from every occupancy (bit p set for a disk at cell p)
+    # to the occupancy of cells, by bfs back from it; telling the disks apart only adds
+    # constraints, so these are lower bounds for distinct disks, and unlike disk_estimate
+    # they count the single steps a packed row needs when there is nothing to jump over
+    # None when there are more than limit occupancies to tabulate
+    if math.comb(length, sum(1 for d in cells if d)) > limit:
+        return None
+    origin = sum(1 << p for p, d in enumerate(cells) if d)
+    distances = {origin: 0}
+    queue = collections.deque([origin])
+    while queue:
+        mask = queue.popleft()
+        moves = distances[mask] + 1
+        for p in range(length):
+            if not mask >> p & 1:
+                continue
+            for q in (p + 2, p + 1, p - 1, p - 2):
+                if q < 0 or q >= length or mask >> q & 1:
+                    continue
+                if (q == p + 2 or q == p - 2) and not mask >> ((p + q) // 2) & 1:
+                    continue
+                child = mask ^ (1 << p) ^ (1 << q)
+                if child not in distances:
+                    distances[child] = moves
+                    queue.append(child)
+    return distances
+
+def disk_bidirectional_a_star(start, goal, stats=None, max_states=2000000):
+    # A* from both ends at once, each side guided towards the other end (front to end) by
+    # the larger of disk_estimate, whose parts are updated per move rather than recomputed,
+    # and disk_occupancy_distances; states are ints with cell p as base-(n+1) digit p
+    # the side with the smaller frontier expands next, and the search stops once either
+    # side's smallest f reaches the best meeting cost, so the moves are optimal
+    # a state is stored as one int, g << 17 | closed << 16 | from cell << 8 | to cell (the
+    # move that reached it, the root has 0), and the search gives up, returning None, once
+    # both sides together hold max_states states
+    length = len(start)
+    base = max(list(start) + list(goal)) + 1
+    powers = [base ** p for p in range(length + 1)]
+    closed = 1 << 16
+
+    def encode(cells):
+        state = 0
+        for disk in reversed(cells):
+            state = state * base + disk
+        return state
+
+    source, target = encode(start), encode(goal)
+    if source == target:
+        return []
+    if sorted(start) != sorted(goal):
+        return None
+    goal_cells = dict((d, cell) for cell, d in enumerate(goal) if d > 0)
+    start_cells = dict((d, cell) for cell, d in enumerate(start) if d > 0)
+    # per side: state -> packed entry, target cells, occupancy distances to the other end,
+    # heap of (f, h, state)
+    sides = []
+    for state, cells, towards, end in ((source, start, goal_cells, goal), (target, goal, start_cells, start)):
+        table = disk_occupancy_distances(length, end)
+        steps, pairs = disk_estimate(cells, towards)
+        h = max(steps, pairs)
+        if table is not None:
+            h = max(h, table[sum(1 << p for p, d in enumerate(cells) if d)])
+        sides.append(({state: 0}, towards, table, [(h, h, state)]))
+    best, meet = math.inf, None
+    while sides[0][3] and sides[1][3]:
+        if max(sides[0][3][0][0], sides[1][3][0][0]) >= best:
+            break
+        reverse = len(sides[1][3]) < len(sides[0][3])
+        seen, towards, table, frontier = sides[reverse]
+        other = sides[not reverse][0]
+        f, h, state = heapq.heappop(frontier)
+        g = f - h
+        entry = seen[state]
+        if entry & closed or g > entry >> 17:
+            if stats is not None:
+                stats.duplicates_pruned += 1
+            continue
+        seen[state] = entry | closed
+        if stats is not None:
+            stats.nodes_expanded += 1
+            stats.frontier(len(sides[0][3]) + len(sides[1][3]) + 1)
+            stats.visited_size = len(sides[0][0]) + len(sides[1][0])
+        cells = []
+        mask = 0
+        rest = state
+        for p in range(length):
+            rest, disk = divmod(rest, base)
+            cells.append(disk)
+            if disk:
+                mask |= 1 << p
+        steps, pairs = disk_estimate(cells, towards)
+        g += 1
+        for p in range(length):
+            disk = cells[p]
+            if not disk:
+                continue
+            home = towards[disk]
+            for q in (p + 2, p + 1, p - 1, p - 2):
+                if q < 0 or q >= length or cells[q]:
+                    continue
+                new_pairs = pairs
+                if q == p + 2 or q == p - 2:
+                    jumped = cells[(p + q) // 2]
+                    if not jumped:
+                        continue
+                    # the jumped pair swaps order: right if it now matches the target
+                    if (towards[jumped] < home) == (q > p):
+                        new_pairs -= 1
+                    else:
+                        new_pairs += 1
+                child = state + disk * (powers[q] - powers[p])
+                if stats is not None:
+                    stats.nodes_generated += 1
+                entry = seen.get(child)
+                if entry is not None and (entry & closed or g >= entry >> 17):
+                    if stats is not None:
+                        stats.duplicates_pruned += 1
+                    continue
+                if entry is None and len(seen) + len(other) >= max_states:
+                    return None
+                seen[child] = g << 17 | p << 8 | q
+                if child in other and g + (other[child] >> 17) < best:
+                    best, meet = g + (other[child] >> 17), child
+                new_steps = steps + (abs(q - home) + 1) // 2 - (abs(p - home) + 1) // 2
+                h = max(new_steps, new_pairs)
+                if table is not None:
+                    h = max(h, table[mask ^ (1 << p) ^ (1 << q)])
+                heapq.heappush(frontier, (g + h, h, child))
+    if meet is None:
+        return None
+    path = []
+    for seen, backward in ((sides[0][0], False), (sides[1][0], True)):
+        moves = []
+        state = meet
+        while seen[state] & 0xffff:
+            p, q = seen[state] >> 8 & 0xff, seen[state] & 0xff
+            state -= state // powers[q] % base * (powers[q] - powers[p])
+            moves.append((q, p) if backward else (p, q))
+        if not backward:
+            moves.reverse()
+        path.extend(moves)
+    return path
+
+def solve_distinct_disks(length, n, bidirectional=False):
     disks = []
     for i in range(length):
         if i < n:
@@ -459,5 +1511,5 @@ def solve_distinct_disks(length, n):
         else: 
             disks.append(0) 
     p = Disk(n, length, disks)
-    return p.find_solution_a_star()
+    return p.find_solution_a_star(bidirectional)
    
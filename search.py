@@ -0,0 +1,294 @@
+############################################################
+# Imports
+############################################################
+
+import collections
+import heapq
+import itertools
+import math
+import os
+import pickle
+import time
+from search_stats import timed
+
+############################################################
+# Section 1: Problem Protocol
+############################################################
+
+class Problem(object):
+
+    # a search problem over hashable, compact states (ints, tuples, bytes); the puzzle
+    # classes expose one through as_problem()
+
+    def initial(self):
+        raise NotImplementedError
+
+    def is_goal(self, state):
+        raise NotImplementedError
+
+    def successors(self, state):
+        # yields (move, next_state, step_cost)
+        raise NotImplementedError
+
+    def heuristic(self, state):
+        return 0
+
+def path_to(parents, state):
+    # parents maps a state to (parent_state, move), the initial state to None
+    moves = []
+    while parents[state] is not None:
+        state, move = parents[state]
+        moves.append(move)
+    moves.reverse()
+    return moves
+
+############################################################
+# Section 2: Uninformed Search
+############################################################
+
+def bfs(problem, stats=None):
+    start = problem.initial()
+    if problem.is_goal(start):
+        return []
+    parents = {start: None}
+    queue = collections.deque([start])
+    while queue:
+        state = queue.popleft()
+        if stats is not None:
+            stats.nodes_expanded += 1
+            stats.frontier(len(queue) + 1)
+            stats.visited_size = len(parents)
+        for move, child, cost in problem.successors(state):
+            if stats is not None:
+                stats.nodes_generated += 1
+            if child in parents:
+                if stats is not None:
+                    stats.duplicates_pruned += 1
+                continue
+            parents[child] = (state, move)
+            if problem.is_goal(child):
+                return path_to(parents, child)
+            queue.append(child)
+    return None
+
+def dfs(problem, limit=None, stats=None):
+    # depth first with an explicit stack of successor iterators; only the states on the
+    # current path are remembered, so memory is O(depth)
+    return dfs_helper(problem, limit, stats)[0]
+
+def dfs_helper(problem, limit, stats):
+    # returns (moves or None, whether some path was cut off at limit)
+    start = problem.initial()
+    path_states = [start]
+    on_path = {start}
+    moves = []
+    stack = [iter(problem.successors(start))]
+    cutoff = False
+    if problem.is_goal(start):
+        return [], False
+    while stack:
+        if limit is not None and len(moves) >= limit:
+            child = None
+            cutoff = cutoff or next(stack[-1], None) is not None
+        else:
+            child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+            if moves:
+                moves.pop()
+                on_path.discard(path_states.pop())
+            continue
+        move, state, cost = child
+        if stats is not None:
+            stats.nodes_generated += 1
+        if state in on_path:
+            if stats is not None:
+                stats.duplicates_pruned += 1
+            continue
+        moves.append(move)
+        if problem.is_goal(state):
+            return moves, cutoff
+        if stats is not None:
+            stats.nodes_expanded += 1
+            stats.frontier(len(stack) + 1)
+        path_states.append(state)
+        on_path.add(state)
+        stack.append(iter(problem.successors(state)))
+    return None, cutoff
+
+def iddfs(problem, max_depth=None, stats=None):
+    # stops early once a depth finishes without cutting any path off: nothing deeper exists
+    depth = 0
+    while max_depth is None or depth <= max_depth:
+        moves, cutoff = dfs_helper(problem, depth, stats)
+        if moves is not None:
+            return moves
+        if not cutoff:
+            return None
+        depth += 1
+    return None
+
+############################################################
+# Section 3: Best-First Search
+############################################################
+
+def best_first(problem, weight, use_heuristic, stats=None):
+    # f = g + weight * h on a heapq frontier; ties go to the deeper node (larger g), then to
+    # the older one, so the heap never has to compare states
+    start = problem.initial()
+    counter = itertools.count()
+    h = problem.heuristic(start) if use_heuristic else 0
+    frontier = [(weight * h, 0, next(counter), start)]
+    best_g = {start: 0}
+    parents = {start: None}
+    closed = set()
+    while frontier:
+        f, neg_g, tie, state = heapq.heappop(frontier)
+        if state in closed:
+            if stats is not None:
+                stats.duplicates_pruned += 1
+            continue
+        if problem.is_goal(state):
+            return path_to(parents, state)
+        closed.add(state)
+        g = -neg_g
+        if stats is not None:
+            stats.nodes_expanded += 1
+            stats.frontier(len(frontier) + 1)
+            stats.visited_size = len(closed)
+        for move, child, cost in problem.successors(state):
+            if stats is not None:
+                stats.nodes_generated += 1
+            new_g = g + cost
+            if child in closed or new_g >= best_g.get(child, float("inf")):
+                if stats is not None:
+                    stats.duplicates_pruned += 1
+                continue
+            best_g[child] = new_g
+            parents[child] = (state, move)
+            h = problem.heuristic(child) if use_heuristic else 0
+            heapq.heappush(frontier, (new_g + weight * h, -new_g, next(counter), child))
+    return None
+
+def uniform_cost(problem, stats=None):
+    return best_first(problem, 1, False, stats)
+
+def a_star(problem, stats=None):
+    return best_first(problem, 1, True, stats)
+
+def weighted_a_star(problem, weight, stats=None):
+    # solutions cost at most weight times the optimum when the heuristic is admissible
+    return best_first(problem, weight, True, stats)
+
+def anytime_a_star(problem, weight=3.0, step=0.5, time_limit=None, node_limit=None, stats=None):
+    # ARA*: weighted A* with a falling weight, each pass reusing the g values, parents and
+    # frontier of the last; states improved after being closed wait in incons until the next
+    # pass instead of being expanded again in this one
+    # stops when a pass with weight 1 finishes, or after time_limit seconds or node_limit
+    # expansions, and returns (moves, bound): the best moves found (None if none yet) and a
+    # factor their cost is known to be within of the optimum (1 means optimal); the bound
+    # needs a consistent heuristic
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    start = problem.initial()
+    if problem.is_goal(start):
+        return [], 1.0
+    counter = itertools.count()
+    g = {start: 0}
+    h = {start: problem.heuristic(start)}
+    parents = {start: None}
+    frontier = []
+    incons = {start}
+    best, best_cost = None, math.inf
+    bound = math.inf
+    expanded = 0
+    while True:
+        # (re)key the frontier and incons for this pass's weight, dropping stale entries
+        states = incons.union(state for f, tie, cost, state in frontier if cost == g[state])
+        frontier = [(round(g[state] + weight * h[state], 9), next(counter), g[state], state) for state in states]
+        heapq.heapify(frontier)
+        incons = set()
+        closed = set()
+        stopped = False
+        while frontier and frontier[0][0] < best_cost:
+            if (node_limit is not None and expanded >= node_limit) or (deadline is not None and time.perf_counter() >= deadline):
+                stopped = True
+                break
+            f, tie, cost, state = heapq.heappop(frontier)
+            if cost != g[state] or state in closed:
+                if stats is not None:
+                    stats.duplicates_pruned += 1
+                continue
+            closed.add(state)
+            expanded += 1
+            if stats is not None:
+                stats.nodes_expanded += 1
+                stats.frontier(len(frontier) + 1)
+                stats.visited_size = len(g)
+            for move, child, step_cost in problem.successors(state):
+                if stats is not None:
+                    stats.nodes_generated += 1
+                new_g = cost + step_cost
+                if new_g >= g.get(child, math.inf):
+                    if stats is not None:
+                        stats.duplicates_pruned += 1
+                    continue
+                g[child] = new_g
+                parents[child] = (state, move)
+                if problem.is_goal(child):
+                    if new_g < best_cost:
+                        best, best_cost = child, new_g
+                    continue
+                if child not in h:
+                    h[child] = problem.heuristic(child)
+                if child in closed:
+                    incons.add(child)
+                else:
+                    heapq.heappush(frontier, (round(new_g + weight * h[child], 9), next(counter), new_g, child))
+        # every cheaper path runs through a state still waiting, so the cheapest g + h among
+        # them bounds the optimum from below
+        lower = min([g[state] + h[state] for f, tie, cost, state in frontier if cost == g[state]] +
+                    [g[state] + h[state] for state in incons] + [best_cost])
+        if best is not None:
+            bound = min(bound, best_cost / lower if lower > 0 else 1.0)
+            if not stopped: # a finished pass is within its weight
+                bound = min(bound, weight)
+        if stopped or weight <= 1:
+            break
+        weight = max(1.0, weight - step)
+    if best is None:
+        return None, bound
+    return path_to(parents, best), max(bound, 1.0)
+
+SEARCHES = {
+    "bfs": bfs,
+    "dfs": dfs,
+    "iddfs": iddfs,
+    "ucs": uniform_cost,
+    "a_star": a_star,
+}
+
+def solve(problem, algorithm="a_star", stats=None, **options):
+    # runs one of SEARCHES by name; weighted_a_star takes weight=...
+    with timed(stats):
+        if algorithm == "weighted_a_star":
+            return weighted_a_star(problem, options.get("weight", 2), stats)
+        if algorithm not in SEARCHES:
+            raise ValueError("unknown algorithm: %r" % (algorithm,))
+        return SEARCHES[algorithm](problem, stats=stats, **options)
+
+############################################################
+# Section 4: Persistence
+############################################################
+
+def atomic_pickle(obj, path):
+    # pickles obj to a temporary file next to path and renames it over path, which is
+    # atomic, so readers never see half a file
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
@@ -0,0 +1,73 @@
+############################################################
+# Imports
+############################################################
+
+import contextlib
+import json
+import time
+
+############################################################
+# Search Statistics
+############################################################
+
+class SearchStats(object):
+
+    # counters filled in by the solvers that accept a stats argument; solvers only touch
+    # them behind an "if stats is not None" check, so passing nothing costs nothing
+    FIELDS = ["nodes_expanded", "nodes_generated", "duplicates_pruned", "peak_frontier", "visited_size", "wall_time"]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.nodes_expanded = 0
+        self.nodes_generated = 0
+        self.duplicates_pruned = 0
+        self.peak_frontier = 0
+        self.visited_size = 0
+        self.wall_time = 0.0
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def stop(self):
+        if self.started is not None:
+            self.wall_time += time.perf_counter() - self.started
+            self.started = None
+
+    def frontier(self, size):
+        if size > self.peak_frontier:
+            self.peak_frontier = size
+
+    def nodes_per_second(self):
+        if self.wall_time <= 0:
+            return 0.0
+        return self.nodes_expanded / self.wall_time
+
+    def as_dict(self):
+        stats = {}
+        for field in SearchStats.FIELDS:
+            stats[field] = getattr(self, field)
+        stats["nodes_per_second"] = self.nodes_per_second()
+        return stats
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+    def __repr__(self):
+        return "SearchStats(%s)" % ", ".join("%s=%r" % item for item in sorted(self.as_dict().items()))
+
+@contextlib.contextmanager
+def timed(stats):
+    # adds the time spent in the block to stats.wall_time; every solver entry point takes
+    # stats=None, a SearchStats filled in with what the search did, and wraps its work in
+    # this, which does nothing when stats is None
+    if stats is None:
+        yield
+        return
+    stats.start()
+    try:
+        yield
+    finally:
+        stats.stop()
@@ -6,6 +6,12 @@
 import random
 import copy
 import math
+import concurrent.futures
+import collections
+import os
+import pickle
+from search import Problem, atomic_pickle
+from search_stats import timed
 
 ############################################################
 # Section 1: N-Queens
@@ -42,10 +48,153 @@ def dfs(n, board, solutions):
             dfs(n, new_b, solutions) # if it is valid, but NOT full, do more DFS
     return solutions
 
-def n_queens_solutions(n):
-    board = []
-    solutions = dfs(n, board,[])
-    return solutions
+def n_queens_generate(n, prefix=()):
+    # bitmask backtracking: columns and both diagonals are ints, so a placement is O(1)
+    # solutions are yielded lazily, in the same order as dfs
+    # prefix fixes the columns of the first rows, which must be a valid partial board
+    full = (1 << n) - 1
+    first = len(prefix)
+    if first == n:
+        yield list(prefix)
+        return
+    board = list(prefix) + [0] * (n - first)
+    avail = [0] * n # columns still free on each row
+    cols = [0] * n
+    left = [0] * n # diagonals attacking the row, shifted towards higher columns
+    right = [0] * n # diagonals attacking the row, shifted towards lower columns
+    c = l = r = 0
+    for col in prefix:
+        bit = 1 << col
+        c, l, r = c | bit, ((l | bit) << 1) & full, (r | bit) >> 1
+    cols[first] = c
+    left[first] = l
+    right[first] = r
+    avail[first] = full & ~(c | l | r)
+    row = first
+    while row >= first:
+        a = avail[row]
+        if not a: # nothing left on this row, backtrack
+            row -= 1
+            continue
+        bit = a & -a # lowest free column
+        avail[row] = a ^ bit
+        board[row] = bit.bit_length() - 1
+        if row == n - 1: # the board is full
+            yield list(board)
+            continue
+        c = cols[row] | bit
+        l = ((left[row] | bit) << 1) & full
+        r = (right[row] | bit) >> 1
+        row += 1
+        cols[row] = c
+        left[row] = l
+        right[row] = r
+        avail[row] = full & ~(c | l | r)
+
+def n_queens_count_helper(full, cols, left, right):
+    if cols == full: # every column is taken, so every row has a queen
+        return 1
+    total = 0
+    avail = full & ~(cols | left | right)
+    while avail:
+        bit = avail & -avail
+        avail ^= bit
+        total += n_queens_count_helper(full, cols | bit, ((left | bit) << 1) & full, (right | bit) >> 1)
+    return total
+
+def n_queens_count(n):
+    # count the solutions without storing any of them
+    return n_queens_count_helper((1 << n) - 1, 0, 0, 0)
+
+def n_queens_prefixes(n):
+    # first-two-row prefixes that cover half the board: every other solution is the mirror
+    # image (col -> n-1-col) of one found under these prefixes
+    prefixes = []
+    for c0 in range((n + 1) // 2):
+        for c1 in range(n):
+            if abs(c1 - c0) <= 1:
+                continue
+            if 2 * c0 == n - 1 and c1 > c0: # middle column on odd boards, mirror on the second row
+                continue
+            prefixes.append((c0, c1))
+    return prefixes
+
+def n_queens_prefix_task(n, prefix, count_only):
+    # runs in a worker process
+    if not count_only:
+        return list(n_queens_generate(n, prefix))
+    full = (1 << n) - 1
+    c = l = r = 0
+    for col in prefix:
+        bit = 1 << col
+        c, l, r = c | bit, ((l | bit) << 1) & full, (r | bit) >> 1
+    return n_queens_count_helper(full, c, l, r)
+
+def n_queens_parallel_count(n, workers=None):
+    prefixes = n_queens_prefixes(n)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        counts = pool.map(n_queens_prefix_task, [n] * len(prefixes), prefixes, [True] * len(prefixes))
+        return 2 * sum(counts)
+
+def n_queens_parallel_generate(n, workers=None, mirror=True):
+    # solutions come out in the sequential engine's order, prefix by prefix; at most two
+    # prefixes per worker are in flight and a prefix's solutions are dropped once yielded
+    # mirror solves only the prefixes from n_queens_prefixes and yields the rest as their
+    # mirror images, which halves the work but holds each of those prefixes' solutions until
+    # its mirror image comes up; without it every prefix is solved, so nothing is held
+    if workers is None:
+        workers = os.cpu_count() or 1
+    half = set(n_queens_prefixes(n)) if mirror else None
+    order = [] # (prefix to solve or reuse, whether to yield its mirror image), in dfs order
+    for c0 in range(n):
+        for c1 in range(n):
+            if abs(c1 - c0) <= 1:
+                continue
+            if half is None or (c0, c1) in half:
+                order.append(((c0, c1), False))
+            else:
+                order.append(((n - 1 - c0, n - 1 - c1), True))
+    tasks = [prefix for prefix, mirrored in order if not mirrored]
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {}
+        held = {}
+        submitted = 0
+        for prefix, mirrored in order:
+            while submitted < len(tasks) and len(futures) < 2 * workers:
+                futures[tasks[submitted]] = pool.submit(n_queens_prefix_task, n, tasks[submitted], False)
+                submitted += 1
+            if mirrored:
+                # mirroring reverses the order of the solutions under a prefix
+                for board in reversed(held.pop(prefix)):
+                    yield [n - 1 - col for col in board]
+            else:
+                boards = futures.pop(prefix).result()
+                if half is not None:
+                    held[prefix] = boards
+                for board in boards:
+                    yield board
+                boards = None
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def n_queens_solutions(n, mode="list", workers=1):
+    # mode "list" returns every solution, "lazy" a generator over them, "count" only their number
+    # workers > 1 (or None for one per cpu) splits the search across processes
+    parallel = (workers is None or workers > 1) and n >= 4
+    if mode == "list":
+        if parallel:
+            return list(n_queens_parallel_generate(n, workers))
+        return list(n_queens_generate(n))
+    if mode == "lazy":
+        if parallel:
+            return n_queens_parallel_generate(n, workers, mirror=False)
+        return n_queens_generate(n)
+    if mode == "count":
+        if parallel:
+            return n_queens_parallel_count(n, workers)
+        return n_queens_count(n)
+    raise ValueError("unknown mode: %r" % (mode,))
 
 ############################################################
 # Section 2: Lights Out
@@ -98,7 +247,81 @@ class LightsOutPuzzle(object):
                 puzzle.perform_move(i,j)
                 yield (i,j),puzzle
 
-    def find_solution(self):
+    def find_solution(self, method="gf2", stats=None):
+        # method "gf2" solves the toggle system by elimination with the cached per-size matrices,
+        # "bfs" searches board states, "compact" runs the same bfs on int-encoded boards;
+        # presses commute and a double press cancels, so the fewest presses gf2 picks is as
+        # short as the bfs path, though the moves come back in row-major order
+        if method not in ("bfs", "gf2", "compact"):
+            raise ValueError("unknown method: %r" % (method,))
+        with timed(stats):
+            if method == "bfs":
+                return self.find_solution_bfs(stats)
+            if method == "gf2":
+                return self.find_solution_gf2(stats)
+            return self.find_solution_compact(stats)
+
+    def as_problem(self):
+        return LightsOutProblem(self)
+
+    def find_solution_gf2(self, stats=None):
+        # pressing a cell adds its toggle column to the board over GF(2), so a solution is any x
+        # with A x = b; the fewest presses is the lightest x in the coset x0 + null(A)
+        pseudo_inverse, checks, null_basis = lights_out_cache.get(self.rows, self.cols)
+        target = lights_out_pack(self.board)
+        for check in checks: # b must be orthogonal to the left null space of A
+            if (check & target).bit_count() & 1:
+                return None
+        presses = 0
+        for var in range(len(pseudo_inverse)):
+            if (pseudo_inverse[var] & target).bit_count() & 1:
+                presses |= 1 << var
+        best = presses
+        # gray code walk over the null space, one xor per candidate
+        if stats is not None:
+            stats.nodes_expanded += 1 << len(null_basis)
+            stats.nodes_generated += 1 << len(null_basis)
+        for k in range(1, 1 << len(null_basis)):
+            presses ^= null_basis[(k & -k).bit_length() - 1]
+            if presses.bit_count() < best.bit_count():
+                best = presses
+        return [divmod(var, self.cols) for var in range(self.rows * self.cols) if best >> var & 1]
+
+    def find_solution_compact(self, stats=None):
+        # same search as find_solution_bfs, but a board is one int and a press is one xor;
+        # each state keeps only a pointer to its parent and the move that reached it
+        start = lights_out_pack(self.board)
+        if start == 0:
+            return []
+        masks = lights_out_toggle_masks(self.rows, self.cols)
+        moves = [divmod(var, self.cols) for var in range(len(masks))]
+        parents = {start: None}
+        queue = collections.deque([start])
+        while queue:
+            state = queue.popleft()
+            if stats is not None:
+                stats.nodes_expanded += 1
+                stats.nodes_generated += len(masks)
+                stats.frontier(len(queue) + 1)
+                stats.visited_size = len(parents)
+            for var in range(len(masks)):
+                child = state ^ masks[var]
+                if child in parents:
+                    if stats is not None:
+                        stats.duplicates_pruned += 1
+                    continue
+                parents[child] = (state, var)
+                if child == 0:
+                    path = []
+                    while parents[child] is not None:
+                        child, var = parents[child]
+                        path.append(moves[var])
+                    path.reverse()
+                    return path
+                queue.append(child)
+        return None
+
+    def find_solution_bfs(self, stats=None):
         queue = [] # queue of all unvisited instances of the puzzle
         queue.append(self) 
         visited = set()
@@ -107,7 +330,13 @@ class LightsOutPuzzle(object):
         if self.is_solved():
             return []
         while len(queue) > 0: # while the queue isn't empty
+            if stats is not None:
+                stats.nodes_expanded += 1
+                stats.frontier(len(queue))
+                stats.visited_size = len(visited)
             for move, new_p in queue[0].successors(): # pop off the first element of the queue, and iterate through its successors
+                if stats is not None:
+                    stats.nodes_generated += 1
                 for i in range(len(queue[0].moves)):
                     new_p.moves.append(queue[0].moves[i])
                 new_p.moves.append(move) # append the move made to get to that successor to the puzzle
@@ -117,6 +346,8 @@ class LightsOutPuzzle(object):
                 if board_prev not in visited:
                     queue.append(new_p) # if not solved, just add it to the queue
                     visited.add(board_prev)
+                elif stats is not None:
+                    stats.duplicates_pruned += 1
             queue.pop(0) # remove the front element of the queue, whose children we have checked already
         return None
 
@@ -129,6 +360,133 @@ def create_puzzle(rows, cols):
         big_list.append(list)
     return LightsOutPuzzle(big_list)
 
+def lights_out_pack(board):
+    # cell (i, j) is bit i * cols + j
+    state = 0
+    bit = 1
+    for row in board:
+        for cell in row:
+            if cell:
+                state |= bit
+            bit <<= 1
+    return state
+
+def lights_out_toggle_masks(rows, cols):
+    # masks[i * cols + j] holds the cells flipped by pressing (i, j)
+    masks = []
+    for i in range(rows):
+        for j in range(cols):
+            mask = 1 << (i * cols + j)
+            if i > 0:
+                mask |= 1 << ((i - 1) * cols + j)
+            if i < rows - 1:
+                mask |= 1 << ((i + 1) * cols + j)
+            if j > 0:
+                mask |= 1 << (i * cols + j - 1)
+            if j < cols - 1:
+                mask |= 1 << (i * cols + j + 1)
+            masks.append(mask)
+    return masks
+
+def lights_out_factorization(rows, cols):
+    # gauss-jordan elimination of the (symmetric) toggle matrix A, each row packed in an int
+    # with an identity block above bit n recording the row operations T, so that T A = R
+    # returns (pseudo_inverse, checks, null_basis):
+    #   pseudo_inverse[v] . b  is press v of a particular solution (free presses set to 0)
+    #   checks are the rows of T for the zero rows of R, b is solvable iff all c . b == 0
+    #   null_basis spans the press sets that leave every light unchanged
+    n = rows * cols
+    mask = (1 << n) - 1
+    matrix = [toggle | (1 << (n + i)) for i, toggle in enumerate(lights_out_toggle_masks(rows, cols))]
+    pivots = [] # (column, row index) of each pivot
+    top = 0
+    for col in range(n):
+        bit = 1 << col
+        pivot = None
+        for i in range(top, n):
+            if matrix[i] & bit:
+                pivot = i
+                break
+        if pivot is None:
+            continue
+        matrix[top], matrix[pivot] = matrix[pivot], matrix[top]
+        row = matrix[top]
+        for i in range(n):
+            if i != top and matrix[i] & bit:
+                matrix[i] ^= row
+        pivots.append((col, top))
+        top += 1
+    pseudo_inverse = [0] * n
+    pivot_cols = set()
+    for col, i in pivots:
+        pseudo_inverse[col] = matrix[i] >> n
+        pivot_cols.add(col)
+    checks = [matrix[i] >> n for i in range(top, n)]
+    null_basis = []
+    for free in range(n):
+        if free in pivot_cols:
+            continue
+        vector = 1 << free
+        for col, i in pivots:
+            if matrix[i] & mask & (1 << free):
+                vector |= 1 << col
+        null_basis.append(vector)
+    return pseudo_inverse, checks, null_basis
+
+class LightsOutProblem(Problem):
+
+    # int-encoded boards for the generic searches in search.py
+    def __init__(self, puzzle):
+        self.start = lights_out_pack(puzzle.get_board())
+        self.masks = lights_out_toggle_masks(puzzle.rows, puzzle.cols)
+        self.moves = [divmod(var, puzzle.cols) for var in range(len(self.masks))]
+
+    def initial(self):
+        return self.start
+
+    def is_goal(self, state):
+        return state == 0
+
+    def successors(self, state):
+        for var in range(len(self.masks)):
+            yield self.moves[var], state ^ self.masks[var], 1
+
+class LightsOutCache(object):
+
+    # lru cache of lights_out_factorization keyed by (rows, cols), optionally backed by a
+    # directory of pickles so other processes and later runs skip the elimination
+    def __init__(self, maxsize=32, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.entries = collections.OrderedDict()
+
+    def path(self, rows, cols):
+        return os.path.join(self.directory, "lights_out_%dx%d.pickle" % (rows, cols))
+
+    def get(self, rows, cols):
+        key = (rows, cols)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        factors = None
+        if self.directory is not None and os.path.exists(self.path(rows, cols)):
+            with open(self.path(rows, cols), "rb") as f:
+                factors = pickle.load(f)
+        if factors is None:
+            factors = lights_out_factorization(rows, cols)
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                atomic_pickle(factors, self.path(rows, cols))
+        self.entries[key] = factors
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return factors
+
+    def clear(self):
+        self.entries.clear()
+
+lights_out_cache = LightsOutCache()
+
 ############################################################
 # Section 3: Linear Disk Movement
 ############################################################
@@ -211,7 +569,22 @@ class Disk(object):
                 return False
         return True
                     
-    def find_solution(self):
+    def find_solution(self, bidirectional=False, stats=None):
+        with timed(stats):
+            if bidirectional:
+                start = [1 if disk > 0 else 0 for disk in self.disks]
+                goal = [0] * (self.length - self.n) + [1] * self.n
+                return disk_bidirectional_bfs(start, goal, stats)
+            return self.find_solution_bfs(stats)
+
+    def as_problem(self, distinct=False):
+        if distinct:
+            goal = [0] * (self.length - self.n) + sorted(disk for disk in self.disks if disk > 0)
+            return DiskProblem(list(self.disks), goal)
+        goal = [0] * (self.length - self.n) + [1] * self.n
+        return DiskProblem([1 if disk > 0 else 0 for disk in self.disks], goal)
+
+    def find_solution_bfs(self, stats=None):
         queue = [] 
         queue.append(self) 
         visited = set()
@@ -221,9 +594,15 @@ class Disk(object):
             return []
 
         while len(queue) > 0: 
+            if stats is not None:
+                stats.nodes_expanded += 1
+                stats.frontier(len(queue))
+                stats.visited_size = len(visited)
 
             # SUCCESSORS ARE CHECKED
             for move, new_d in queue[0].successors(): 
+                if stats is not None:
+                    stats.nodes_generated += 1
 
                 new_d_tup = tuple(new_d.get_list())
 
@@ -243,13 +622,23 @@ class Disk(object):
                     # ADD THE NEW_D TO Q IF NOT VISITED AND NOT SOLVED
                     queue.append(new_d) 
 
+                elif stats is not None:
+                    stats.duplicates_pruned += 1
+
                 # IF VISITED, MOVE ON TO THE NEXT NEW_D WITHOUT DOING ANYTHING
             
             # POP OFF THE FIRST ELEMENT OF QUEUE ONCE ALL ITS CHILDREN ARE CHECKED
             queue.pop(0) 
         return None
 
-    def find_solution_distinct(self):
+    def find_solution_distinct(self, bidirectional=False, stats=None):
+        with timed(stats):
+            if bidirectional:
+                goal = [0] * (self.length - self.n) + sorted(disk for disk in self.disks if disk > 0)
+                return disk_bidirectional_bfs(list(self.disks), goal, stats)
+            return self.find_solution_distinct_bfs(stats)
+
+    def find_solution_distinct_bfs(self, stats=None):
         queue = [] 
         queue.append(self) 
         visited = set()
@@ -259,9 +648,15 @@ class Disk(object):
             return []
 
         while len(queue) > 0: 
+            if stats is not None:
+                stats.nodes_expanded += 1
+                stats.frontier(len(queue))
+                stats.visited_size = len(visited)
 
             # SUCCESSORS ARE CHECKED
             for move, new_d in queue[0].successors_distinct(): 
+                if stats is not None:
+                    stats.nodes_generated += 1
                 new_d_tup = tuple(new_d.get_list())
 
                 # PAST VISITATION IS CHECKED
@@ -280,13 +675,145 @@ class Disk(object):
                     # ADD THE NEW_D TO Q IF NOT VISITED AND NOT SOLVED
                     queue.append(new_d) 
 
+                elif stats is not None:
+                    stats.duplicates_pruned += 1
+
                 # IF VISITED, MOVE ON TO THE NEXT NEW_D WITHOUT DOING ANYTHING
             
             # POP OFF THE FIRST ELEMENT OF QUEUE ONCE ALL ITS CHILDREN ARE CHECKED
             queue.pop(0) 
         return None
 
-def solve_identical_disks(length, n):
+def disk_encode(disks, base):
+    # cell p is the base-(n+1) digit p, so a state is a single int
+    state = 0
+    for disk in reversed(disks):
+        state = state * base + disk
+    return state
+
+def disk_successors(state, length, base, powers):
+    # the moves of Disk.successors on an encoded state; moving disk d from p to q adds
+    # d * (base**q - base**p), so no list is copied per child
+    cells = []
+    for p in range(length):
+        state, disk = divmod(state, base)
+        cells.append(disk)
+    state = disk_encode(cells, base)
+    for p in range(length):
+        disk = cells[p]
+        if disk > 0:
+            if p+2 < length and cells[p+1] > 0 and cells[p+2] == 0:
+                yield (p, p+2), state + disk * (powers[p+2] - powers[p])
+            if p+1 < length and cells[p+1] == 0:
+                yield (p, p+1), state + disk * (powers[p+1] - powers[p])
+            if p-1 >= 0 and cells[p-1] == 0:
+                yield (p, p-1), state + disk * (powers[p-1] - powers[p])
+            if p-2 >= 0 and cells[p-1] > 0 and cells[p-2] == 0:
+                yield (p, p-2), state + disk * (powers[p-2] - powers[p])
+
+class DiskProblem(Problem):
+
+    # int-encoded disk rows for the generic searches in search.py, shared with
+    # informed_search; a move shifts one disk at most two cells, so half the summed
+    # distance of each disk to a goal cell of its kind is an admissible heuristic
+    def __init__(self, start, goal):
+        start, goal = list(start), list(goal)
+        self.length = len(start)
+        self.base = max(start + goal) + 1
+        self.powers = [self.base ** p for p in range(self.length + 1)]
+        self.start = disk_encode(start, self.base)
+        self.goal = disk_encode(goal, self.base)
+        self.goal_cells = {} # disk -> its goal cells, left to right
+        for cell, disk in enumerate(goal):
+            if disk > 0:
+                self.goal_cells.setdefault(disk, []).append(cell)
+
+    def initial(self):
+        return self.start
+
+    def is_goal(self, state):
+        return state == self.goal
+
+    def successors(self, state):
+        for move, child in disk_successors(state, self.length, self.base, self.powers):
+            yield move, child, 1
+
+    def heuristic(self, state):
+        # identical disks keep their order, so the k-th of a kind goes to its k-th goal cell
+        seen = {}
+        distance = 0
+        for cell in range(self.length):
+            state, disk = divmod(state, self.base)
+            if disk > 0:
+                k = seen.get(disk, 0)
+                seen[disk] = k + 1
+                distance += abs(cell - self.goal_cells[disk][k])
+        return (distance + 1) // 2
+
+def disk_bidirectional_bfs(start, goal, stats=None):
+    # breadth first search from both ends, one full layer of the smaller frontier at a time;
+    # every move can be undone, so the backward search uses the same successors
+    length = len(start)
+    base = max(start + goal) + 1
+    powers = [base ** p for p in range(length + 1)]
+    source = disk_encode(start, base)
+    target = disk_encode(goal, base)
+    if source == target:
+        return []
+    # state -> (parent, move, depth); backward moves are stored already reversed
+    forward = {source: (None, None, 0)}
+    backward = {target: (None, None, 0)}
+    forward_layer = [source]
+    backward_layer = [target]
+    while forward_layer and backward_layer:
+        if len(forward_layer) <= len(backward_layer):
+            layer, seen, other, reverse = forward_layer, forward, backward, False
+        else:
+            layer, seen, other, reverse = backward_layer, backward, forward, True
+        next_layer = []
+        best = None
+        if stats is not None:
+            stats.frontier(len(forward_layer) + len(backward_layer))
+            stats.visited_size = len(forward) + len(backward)
+        for state in layer:
+            depth = seen[state][2] + 1
+            if stats is not None:
+                stats.nodes_expanded += 1
+            for (p, q), child in disk_successors(state, length, base, powers):
+                if stats is not None:
+                    stats.nodes_generated += 1
+                if child in seen:
+                    if stats is not None:
+                        stats.duplicates_pruned += 1
+                    continue
+                seen[child] = (state, (q, p) if reverse else (p, q), depth)
+                next_layer.append(child)
+                if child in other:
+                    total = depth + other[child][2]
+                    if best is None or total < best[0]:
+                        best = (total, child)
+        if best is not None:
+            meet = best[1]
+            path = []
+            state = meet
+            while forward[state][0] is not None:
+                parent, move, depth = forward[state]
+                path.append(move)
+                state = parent
+            path.reverse()
+            state = meet
+            while backward[state][0] is not None:
+                parent, move, depth = backward[state]
+                path.append(move)
+                state = parent
+            return path
+        if reverse:
+            backward_layer = next_layer
+        else:
+            forward_layer = next_layer
+    return None
+
+def solve_identical_disks(length, n, bidirectional=False):
     disks = []
     for i in range(length):
         if i < n:
@@ -294,11 +821,11 @@ def solve_identical_disks(length, n):
         else: 
             disks.append(0) 
     d = Disk(n, length, disks)
-    solution = d.find_solution()
+    solution = d.find_solution(bidirectional)
     return solution
 
 
-def solve_distinct_disks(length, n):
+def solve_distinct_disks(length, n, bidirectional=False):
     print(length, n)
     disks = []
     for i in range(length):
@@ -307,6 +834,6 @@ def solve_distinct_disks(length, n):
         else: 
             disks.append(0) 
     d = Disk(n, length, disks)
-    solution = d.find_solution_distinct()
+    solution = d.find_solution_distinct(bidirectional)
     return solution
 